@@ -6,6 +6,7 @@ Fixed all issues identified in the codebase analysis document.
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import StaticPool
 from datetime import datetime, timedelta, time
 import json
 import os
@@ -22,7 +23,17 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_scheduling.db'
+app.config['TESTING'] = os.environ.get('FLASK_TESTING') == '1'
+if app.config['TESTING']:
+    # Throwaway in-memory database; StaticPool keeps every session on the one
+    # connection that holds it
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': StaticPool,
+        'connect_args': {'check_same_thread': False}
+    }
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_scheduling.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'hospital-scheduling-secret-key-change-in-production')
 
@@ -221,9 +232,6 @@ class SchedulingEngine:
             for day_offset in range(days):
                 current_date = start_date + timedelta(days=day_offset)
                 is_weekend = current_date.weekday() >= 5
-
-                if current_date.weekday() == 0:
-                    pass 
                 
                 # Get day shifts
                 day_shifts = self.day_shifts_weekend if is_weekend else self.day_shifts_weekday
@@ -240,18 +248,13 @@ class SchedulingEngine:
                 min_day_coverage = 4 if not is_weekend else 4  # 4 on weekends, 5 on weekdays
                 min_night_coverage = 3
                 
-                # Fill day shift gaps if needed
+                # Report coverage gaps; every eligible non-PTO employee is
+                # already in the available lists, so there is no one to add
                 if len(available_day_employees) < min_day_coverage:
                     logger.warning(f"Day shift coverage gap on {current_date}: {len(available_day_employees)} < {min_day_coverage}")
-                    # Add employees who can work extra (not at max hours) to fill gaps
-                    extra_employees = [e for e in employees if e.id not in day_pto_employees and e not in available_day_employees and self._can_work_day_shift(e)]
-                    available_day_employees.extend(extra_employees[:min_day_coverage - len(available_day_employees)])
                 
-                # Fill night shift gaps if needed
                 if len(available_night_employees) < min_night_coverage:
                     logger.warning(f"Night shift coverage gap on {current_date}: {len(available_night_employees)} < {min_night_coverage}")
-                    extra_employees = [e for e in employees if e.id not in night_pto_employees and e not in available_night_employees and self._can_work_night_shift(e)]
-                    available_night_employees.extend(extra_employees[:min_night_coverage - len(available_night_employees)])
                 
                 # Assign day shifts with fair distribution
                 day_assignments = self._assign_shifts_with_fair_distribution(
@@ -283,7 +286,8 @@ class SchedulingEngine:
         return True  # Everyone can work nights unless specified otherwise
     
     def _assign_shifts_with_fair_distribution(self, shifts, available_employees, date, shift_type):
-        """Assign shifts ensuring fair distribution and coverage"""     
+        """Assign shifts ensuring fair distribution and coverage"""
+        assert available_employees is not None, "available_employees must be passed by the caller"
         assignments = []
 
         # Sort employees by weekly hours worked (ascending) for fair distribution
@@ -6,10 +6,16 @@ Fixed all issues identified in the codebase analysis document.
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import update, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import StaticPool
 from datetime import datetime, timedelta, time
 import json
 import os
 import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from functools import wraps
 
 # Configure logging
@@ -22,7 +28,17 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_scheduling.db'
+app.config['TESTING'] = os.environ.get('FLASK_TESTING') == '1'
+if app.config['TESTING']:
+    # Throwaway in-memory database; StaticPool keeps every session on the one
+    # connection that holds it
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': StaticPool,
+        'connect_args': {'check_same_thread': False}
+    }
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_scheduling.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'hospital-scheduling-secret-key-change-in-production')
 
@@ -47,11 +63,14 @@ class Employee(db.Model):
     shift_preference = db.Column(db.String(10), default='BOTH')  # DAY, NIGHT, BOTH
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Relationships
-    schedules = db.relationship('Schedule', backref='employee', lazy=True)
-    time_off_requests = db.relationship('TimeOffRequest', backref='employee', lazy=True)
-    shift_trades_requested = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.requesting_employee_id', backref='requesting_employee', lazy=True)
-    shift_trades_target = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.target_employee_id', backref='target_employee', lazy=True)
+    # Relationships.  Many-to-one sides are joined-loaded because to_dict()
+    # and the log lines always read them; these collections are never read
+    # by an endpoint, so they stay lazy rather than pulling every schedule
+    # and trade each time an employee is loaded.
+    schedules = db.relationship('Schedule', back_populates='employee', lazy='select')
+    time_off_requests = db.relationship('TimeOffRequest', back_populates='employee', lazy='select')
+    shift_trades_requested = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.requesting_employee_id', back_populates='requesting_employee', lazy='select')
+    shift_trades_target = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.target_employee_id', back_populates='target_employee', lazy='select')
     
     def to_dict(self):
         return {
@@ -84,6 +103,11 @@ class Schedule(db.Model):
     is_coverage = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Relationships
+    employee = db.relationship('Employee', back_populates='schedules', lazy='joined')
+    original_trades = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.original_schedule_id', back_populates='original_schedule', lazy='select')
+    trade_trades = db.relationship('ShiftTrade', foreign_keys='ShiftTrade.trade_schedule_id', back_populates='trade_schedule', lazy='select')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -113,6 +137,9 @@ class TimeOffRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     approved_at = db.Column(db.DateTime, nullable=True)
     
+    # Relationships
+    employee = db.relationship('Employee', back_populates='time_off_requests', lazy='joined')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -137,13 +164,15 @@ class ShiftTrade(db.Model):
     original_schedule_id = db.Column(db.Integer, db.ForeignKey('schedules.id'), nullable=False)
     trade_schedule_id = db.Column(db.Integer, db.ForeignKey('schedules.id'), nullable=False)
     trade_reason = db.Column(db.Text, nullable=True)
-    status = db.Column(db.String(20), default='PENDING')  # PENDING, APPROVED, DENIED
+    status = db.Column(db.String(20), default='PENDING')  # PENDING, APPROVING, APPROVED, DENIED
     approved_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    original_schedule = db.relationship('Schedule', foreign_keys=[original_schedule_id], backref='original_trades')
-    trade_schedule = db.relationship('Schedule', foreign_keys=[trade_schedule_id], backref='trade_trades')
+    requesting_employee = db.relationship('Employee', foreign_keys=[requesting_employee_id], back_populates='shift_trades_requested', lazy='joined')
+    target_employee = db.relationship('Employee', foreign_keys=[target_employee_id], back_populates='shift_trades_target', lazy='joined')
+    original_schedule = db.relationship('Schedule', foreign_keys=[original_schedule_id], back_populates='original_trades', lazy='joined')
+    trade_schedule = db.relationship('Schedule', foreign_keys=[trade_schedule_id], back_populates='trade_trades', lazy='joined')
     
     def to_dict(self):
         def get_shift_info(schedule):
@@ -169,7 +198,6 @@ class ShiftTrade(db.Model):
             'approved_at': self.approved_at.isoformat() if self.approved_at else None,
             'created_at': self.created_at.isoformat()
         }
-    
 
 class Rule(db.Model):
     __tablename__ = 'rules'
@@ -273,9 +301,6 @@ class SchedulingEngine:
             for day_offset in range(days):
                 current_date = start_date + timedelta(days=day_offset)
                 is_weekend = current_date.weekday() >= 5
-
-                if current_date.weekday() == 0:
-                    pass 
                 
                 # Get day shifts
                 day_shifts = self.day_shifts_weekend if is_weekend else self.day_shifts_weekday
@@ -292,18 +317,13 @@ class SchedulingEngine:
                 min_day_coverage = 4 if not is_weekend else 4  # 4 on weekends, 5 on weekdays
                 min_night_coverage = 3
                 
-                # Fill day shift gaps if needed
+                # Report coverage gaps; every eligible non-PTO employee is
+                # already in the available lists, so there is no one to add
                 if len(available_day_employees) < min_day_coverage:
                     logger.warning(f"Day shift coverage gap on {current_date}: {len(available_day_employees)} < {min_day_coverage}")
-                    # Add employees who can work extra (not at max hours) to fill gaps
-                    extra_employees = [e for e in employees if e.id not in day_pto_employees and e not in available_day_employees and self._can_work_day_shift(e)]
-                    available_day_employees.extend(extra_employees[:min_day_coverage - len(available_day_employees)])
                 
-                # Fill night shift gaps if needed
                 if len(available_night_employees) < min_night_coverage:
                     logger.warning(f"Night shift coverage gap on {current_date}: {len(available_night_employees)} < {min_night_coverage}")
-                    extra_employees = [e for e in employees if e.id not in night_pto_employees and e not in available_night_employees and self._can_work_night_shift(e)]
-                    available_night_employees.extend(extra_employees[:min_night_coverage - len(available_night_employees)])
                 
                 # Assign day shifts with fair distribution
                 day_assignments = self._assign_shifts_with_fair_distribution(
@@ -335,7 +355,8 @@ class SchedulingEngine:
         return True  # Everyone can work nights unless specified otherwise
     
     def _assign_shifts_with_fair_distribution(self, shifts, available_employees, date, shift_type):
-        """Assign shifts ensuring fair distribution and coverage"""     
+        """Assign shifts ensuring fair distribution and coverage"""
+        assert available_employees is not None, "available_employees must be passed by the caller"
         assignments = []
 
         # Sort employees by weekly hours worked (ascending) for fair distribution
@@ -1108,11 +1129,17 @@ def approve_timeoff(request_id):
 def deny_timeoff(request_id):
     """Deny time off request"""
     try:
-        req = TimeOffRequest.query.get_or_404(request_id)
-        req.status = 'DENIED'
+        # One UPDATE; its rowcount doubles as the existence check
+        result = db.session.execute(
+            update(TimeOffRequest)
+            .where(TimeOffRequest.id == request_id)
+            .values(status='DENIED')
+        )
         db.session.commit()
+        if not result.rowcount:
+            return jsonify({'success': False, 'error': 'Time off request not found'}), 404
         
-        logger.info(f"Denied time off request {request_id} for {req.employee.name}")
+        logger.info(f"Denied time off request {request_id}")
         return jsonify({'success': True, 'message': 'Time off request denied'})
         
     except Exception as e:
@@ -1120,6 +1147,189 @@ def deny_timeoff(request_id):
         logger.error(f"Error denying time off request: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _parse_id(value):
+    """Integer id from a JSON value, or None.
+
+    Accepts ints and strings of ASCII digits (converted).  Booleans, floats
+    such as 1.9 and Unicode digits such as '²' are rejected, not coerced.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if not (value.isascii() and value.isdigit()):
+            return None
+        return int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+def _bulk_request_ids():
+    """Return the list of integer ids posted as {'ids': [...]}, or None if malformed"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return None
+    parsed = [_parse_id(value) for value in ids]
+    if None in parsed:
+        return None
+    return parsed
+
+@app.route('/api/timeoff/bulk-approve', methods=['POST'])
+def bulk_approve_timeoff():
+    """Approve many pending time off requests in a single UPDATE and commit"""
+    ids = _bulk_request_ids()
+    if ids is None:
+        return jsonify({'success': False, 'error': 'ids must be a non-empty list of request ids'}), 400
+    try:
+        result = db.session.execute(
+            update(TimeOffRequest)
+            .where(TimeOffRequest.id.in_(ids), TimeOffRequest.status == 'PENDING')
+            .values(status='APPROVED', approved_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+        logger.info(f"Bulk approved {result.rowcount} of {len(ids)} time off requests")
+        return jsonify({
+            'success': True,
+            'message': f'Approved {result.rowcount} time off requests',
+            'updated_count': result.rowcount
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk approving time off requests: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Concurrent identical GETs (e.g. several admin tabs refreshing the
+# dashboard) share one DB query instead of each running their own.
+SINGLE_FLIGHT_TIMEOUT = 0.25  # seconds a follower waits before querying itself
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _single_flight(key, loader):
+    """Run loader once for all concurrent callers sharing key"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        try:
+            return future.result(timeout=SINGLE_FLIGHT_TIMEOUT)
+        except FutureTimeoutError:
+            return loader()
+
+    try:
+        result = loader()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _shift_label(schedule_date, shift_type, role):
+    if schedule_date is None:
+        return "Schedule not found"
+    return f"{schedule_date} {shift_type} {role}"
+
+def _load_trades(status_filter):
+    """Query trades for the GET endpoint and return them as plain dicts.
+
+    Selects only the columns the response needs and builds the dicts from
+    the result rows, so no ShiftTrade/Employee/Schedule objects are hydrated
+    into the identity map.
+    """
+    requester = aliased(Employee)
+    target = aliased(Employee)
+    original = aliased(Schedule)
+    traded = aliased(Schedule)
+    stmt = (
+        select(
+            ShiftTrade.id,
+            ShiftTrade.requesting_employee_id,
+            requester.name.label('requesting_employee_name'),
+            ShiftTrade.target_employee_id,
+            target.name.label('target_employee_name'),
+            ShiftTrade.original_schedule_id,
+            original.schedule_date.label('original_date'),
+            original.shift_type.label('original_shift_type'),
+            original.role.label('original_role'),
+            ShiftTrade.trade_schedule_id,
+            traded.schedule_date.label('trade_date'),
+            traded.shift_type.label('trade_shift_type'),
+            traded.role.label('trade_role'),
+            ShiftTrade.trade_reason,
+            ShiftTrade.status,
+            ShiftTrade.approved_at,
+            ShiftTrade.created_at,
+        )
+        .join(requester, ShiftTrade.requesting_employee_id == requester.id)
+        .outerjoin(target, ShiftTrade.target_employee_id == target.id)
+        .outerjoin(original, ShiftTrade.original_schedule_id == original.id)
+        .outerjoin(traded, ShiftTrade.trade_schedule_id == traded.id)
+        .where(requester.active == True)
+    )
+    
+    if status_filter:
+        stmt = stmt.where(ShiftTrade.status == status_filter)
+    
+    rows = db.session.execute(stmt.order_by(ShiftTrade.created_at.desc())).mappings().all()
+    # schedule_date is NOT NULL, so a NULL here means the outer join found no schedule
+    for row in rows:
+        original_exists = row['original_date'] is not None
+        trade_exists = row['trade_date'] is not None
+        if not (original_exists and trade_exists):
+            logger.warning(f"Invalid trade {row['id']}: missing schedules (original: {original_exists}, trade: {trade_exists})")
+    
+    return [
+        {
+            'id': row['id'],
+            'requesting_employee_id': row['requesting_employee_id'],
+            'requesting_employee_name': row['requesting_employee_name'] or "Unknown Employee",
+            'target_employee_id': row['target_employee_id'],
+            'target_employee_name': row['target_employee_name'] or "Unknown Employee",
+            'original_schedule_id': row['original_schedule_id'],
+            'original_shift': _shift_label(row['original_date'], row['original_shift_type'], row['original_role']),
+            'trade_schedule_id': row['trade_schedule_id'],
+            'trade_shift': _shift_label(row['trade_date'], row['trade_shift_type'], row['trade_role']),
+            'trade_reason': row['trade_reason'],
+            'status': row['status'],
+            'approved_at': row['approved_at'].isoformat() if row['approved_at'] else None,
+            'created_at': row['created_at'].isoformat()
+        }
+        for row in rows
+    ]
+
+TRADE_ID_FIELDS = ('requesting_employee_id', 'target_employee_id', 'original_schedule_id', 'trade_schedule_id')
+
+def _parse_trade_create(data):
+    """Validate a POST /api/trades payload before any query is issued.
+
+    Returns (fields, None) on success or (None, error message).  Id fields
+    follow _parse_id, so numeric strings are converted.
+    """
+    if not isinstance(data, dict):
+        return None, 'Request body must be a JSON object'
+
+    fields = {}
+    for name in TRADE_ID_FIELDS:
+        value = _parse_id(data.get(name))
+        if value is None:
+            return None, f'{name} is required and must be an integer'
+        fields[name] = value
+
+    reason = data.get('trade_reason')
+    if reason is not None and not isinstance(reason, str):
+        return None, 'trade_reason must be a string'
+    fields['trade_reason'] = reason
+    return fields, None
+
 # Shift Trade API Routes - Fully implemented
 @app.route('/api/trades', methods=['GET', 'POST'])
 def api_trades():
@@ -1129,26 +1339,14 @@ def api_trades():
         try:
             # Get trades with proper filtering
             status_filter = request.args.get('status')
-            query = ShiftTrade.query.join(Employee, ShiftTrade.requesting_employee_id == Employee.id).filter(
-                Employee.active == True
+            trades = _single_flight(
+                ('/api/trades', request.query_string),
+                lambda: _load_trades(status_filter)
             )
             
-            if status_filter:
-                query = query.filter(ShiftTrade.status == status_filter)
-            
-            trades = query.order_by(ShiftTrade.created_at.desc()).all()
-            valid_trades = []
-            for trade in trades:
-                original_exists = Schedule.query.get(trade.original_schedule_id) is not None
-                trade_exists = Schedule.query.get(trade.trade_schedule_id) is not None
-            if original_exists and trade_exists:
-                valid_trades.append(trade)
-            else:
-                logger.warning(f"Invalid trade {trade.id}: missing schedules (original: {original_exists}, trade: {trade_exists})")
-            
             return jsonify({
                 'success': True,
-                'trades': [trade.to_dict() for trade in trades],
+                'trades': trades,
                 'count': len(trades)
             })
         except Exception as e:
@@ -1157,7 +1355,9 @@ def api_trades():
     
     elif request.method == 'POST':
         try:
-            data = request.json
+            data, error = _parse_trade_create(request.get_json(silent=True))
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
             logger.info(f"Creating shift trade: {data}")
             
             # Validate that both schedules exist and belong to the correct employees
@@ -1188,7 +1388,7 @@ def api_trades():
                 target_employee_id=data['target_employee_id'],
                 original_schedule_id=data['original_schedule_id'],
                 trade_schedule_id=data['trade_schedule_id'],
-                trade_reason=data.get('trade_reason')
+                trade_reason=data['trade_reason']
             )
             
             db.session.add(trade)
@@ -1206,14 +1406,26 @@ def api_trades():
             return jsonify({'success': False, 'error': str(e)}), 400        
     
 
-@app.route('/api/trades/<int:trade_id>/approve', methods=['PUT'])
-def approve_trade(trade_id):
-    """Approve shift trade and perform actual shift swap"""
+def _swap_trade_shifts(trade_id):
+    """Swap the two schedules of an APPROVING trade and mark it APPROVED"""
     try:
-        trade = ShiftTrade.query.get_or_404(trade_id)
+        trade = db.session.get(ShiftTrade, trade_id)
+        if trade is None or trade.status != 'APPROVING':
+            logger.warning(f"Skipping swap for trade {trade_id}: not awaiting approval")
+            return False
         
-        if trade.status != 'PENDING':
-            return jsonify({'success': False, 'error': 'Trade is not pending'}), 400
+        # Flip the status first, conditionally, so the swap and the flip
+        # commit together only if nothing else (a deny, another worker)
+        # changed the trade since it was claimed
+        result = db.session.execute(
+            update(ShiftTrade)
+            .where(ShiftTrade.id == trade_id, ShiftTrade.status == 'APPROVING')
+            .values(status='APPROVED', approved_at=datetime.utcnow())
+        )
+        if not result.rowcount:
+            db.session.rollback()
+            logger.warning(f"Skipping swap for trade {trade_id}: status changed while queued")
+            return False
         
         # Get the schedules to swap
         original_schedule = trade.original_schedule
@@ -1227,17 +1439,90 @@ def approve_trade(trade_id):
         original_schedule.employee_id = target_employee_id
         trade_schedule.employee_id = original_employee_id
         
-        # Update trade status
-        trade.status = 'APPROVED'
-        trade.approved_at = datetime.utcnow()
-        
         db.session.commit()
         
         logger.info(f"Approved shift trade {trade_id}: employees {original_employee_id} and {target_employee_id} swapped shifts")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error swapping shifts for trade {trade_id}: {str(e)}")
+        # Hand the trade back to the approver rather than leaving it stuck
+        db.session.execute(
+            update(ShiftTrade)
+            .where(ShiftTrade.id == trade_id, ShiftTrade.status == 'APPROVING')
+            .values(status='PENDING')
+        )
+        db.session.commit()
+        return False
+
+# Approved trades are swapped by a single background worker, so an approval
+# burst never holds more than one swap transaction open at a time.
+_trade_swap_queue = queue.Queue()
+_trade_swap_worker = None
+_trade_swap_worker_lock = threading.Lock()
+
+def _trade_swap_loop():
+    while True:
+        trade_id = _trade_swap_queue.get()
+        try:
+            with app.app_context():
+                _swap_trade_shifts(trade_id)
+        except Exception as e:
+            logger.error(f"Trade swap worker failed on trade {trade_id}: {str(e)}")
+        finally:
+            _trade_swap_queue.task_done()
+
+def _enqueue_trade_swap(trade_id):
+    global _trade_swap_worker
+
+    with _trade_swap_worker_lock:
+        if _trade_swap_worker is None or not _trade_swap_worker.is_alive():
+            _trade_swap_worker = threading.Thread(target=_trade_swap_loop, name='trade-swap-worker', daemon=True)
+            _trade_swap_worker.start()
+    _trade_swap_queue.put(trade_id)
+
+def _requeue_approving_trades():
+    """Queue swaps for trades left APPROVING by a restart or crash.
+
+    The queue lives in memory, so anything claimed but not yet swapped when
+    the process stopped would otherwise stay APPROVING for good.  Requeueing
+    a trade another process is still swapping is harmless: only one
+    conditional APPROVING -> APPROVED flip can succeed.
+    """
+    trade_ids = db.session.execute(
+        select(ShiftTrade.id).where(ShiftTrade.status == 'APPROVING')
+    ).scalars().all()
+    for trade_id in trade_ids:
+        _enqueue_trade_swap(trade_id)
+    if trade_ids:
+        logger.info(f"Requeued shift swaps for {len(trade_ids)} approving trades")
+    return len(trade_ids)
+
+@app.route('/api/trades/<int:trade_id>/approve', methods=['PUT'])
+def approve_trade(trade_id):
+    """Approve shift trade; the shift swap itself runs on the background worker"""
+    try:
+        # Claim the trade in one UPDATE so concurrent approvals cannot both win
+        result = db.session.execute(
+            update(ShiftTrade)
+            .where(ShiftTrade.id == trade_id, ShiftTrade.status == 'PENDING')
+            .values(status='APPROVING')
+        )
+        db.session.commit()
+        
+        if not result.rowcount:
+            if db.session.get(ShiftTrade, trade_id) is None:
+                return jsonify({'success': False, 'error': 'Trade not found'}), 404
+            return jsonify({'success': False, 'error': 'Trade is not pending'}), 400
+        
+        _enqueue_trade_swap(trade_id)
+        logger.info(f"Queued shift swap for trade {trade_id}")
         return jsonify({
             'success': True,
-            'message': 'Trade approved and shifts swapped successfully'
-        })
+            'status': 'APPROVING',
+            'message': 'Trade approved; shifts are being swapped'
+        }), 202
         
     except Exception as e:
         db.session.rollback()
@@ -1248,9 +1533,18 @@ def approve_trade(trade_id):
 def deny_trade(trade_id):
     """Deny shift trade request"""
     try:
-        trade = ShiftTrade.query.get_or_404(trade_id)
-        trade.status = 'DENIED'
+        # One conditional UPDATE; a trade already claimed for approval is
+        # being (or has been) swapped and can no longer be denied
+        result = db.session.execute(
+            update(ShiftTrade)
+            .where(ShiftTrade.id == trade_id, ShiftTrade.status.notin_(('APPROVING', 'APPROVED')))
+            .values(status='DENIED')
+        )
         db.session.commit()
+        if not result.rowcount:
+            if db.session.get(ShiftTrade, trade_id) is None:
+                return jsonify({'success': False, 'error': 'Trade not found'}), 404
+            return jsonify({'success': False, 'error': 'Trade is already approved'}), 400
         
         logger.info(f"Denied shift trade {trade_id}")
         return jsonify({'success': True, 'message': 'Trade denied successfully'})
@@ -1260,6 +1554,32 @@ def deny_trade(trade_id):
         logger.error(f"Error denying trade: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/trades/bulk-deny', methods=['POST'])
+def bulk_deny_trades():
+    """Deny many pending shift trades in a single UPDATE and commit"""
+    ids = _bulk_request_ids()
+    if ids is None:
+        return jsonify({'success': False, 'error': 'ids must be a non-empty list of trade ids'}), 400
+    try:
+        result = db.session.execute(
+            update(ShiftTrade)
+            .where(ShiftTrade.id.in_(ids), ShiftTrade.status == 'PENDING')
+            .values(status='DENIED')
+        )
+        db.session.commit()
+
+        logger.info(f"Bulk denied {result.rowcount} of {len(ids)} shift trades")
+        return jsonify({
+            'success': True,
+            'message': f'Denied {result.rowcount} shift trades',
+            'updated_count': result.rowcount
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk denying trades: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/trades/cleanup', methods=['POST'])
 def cleanup_trades():
     """Clean up trades with missing schedules"""
@@ -1607,6 +1927,8 @@ def _init_db_once():
         return
     with app.app_context():
         db.create_all()
+        # First request in this process: pick up swaps a previous one never finished
+        _requeue_approving_trades()
     _db_init_done = True     
 
 def create_tables():
@@ -1,13 +1,23 @@
 # tests/test_app_fixed.py
 import json
 import logging
+import os
+import sqlite3
 from datetime import datetime, timedelta, date
 
 import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.orm import scoped_session, sessionmaker
 
-# IMPORTANT: import your app AFTER pytest is loaded so we can monkeypatch easily
+# IMPORTANT: import your app AFTER pytest is loaded so we can monkeypatch easily.
+# FLASK_TESTING must be set first: the app picks its (in-memory) test database
+# when it is imported.
+os.environ.setdefault("FLASK_TESTING", "1")
 import app_fixed as appmod
-from app_fixed import app, db, Employee, Schedule, TimeOffRequest, ShiftTrade
+from app_fixed import app, db, Employee, Schedule
+import database
+import scheduling_engine
+from scheduling_engine import SchedulingEngine
 
 # ---------------------------------------------------------------------------
 # Global logging config for verbose, readable test output
@@ -36,34 +46,51 @@ def _is_testing_env(monkeypatch):
     app.config["PROPAGATE_EXCEPTIONS"] = True
 
 
-@pytest.fixture
-def app_ctx(monkeypatch):
+@pytest.fixture(scope="session")
+def app_session():
     """
-    - Uses the real SQLite file configured in the app (keeps the app wiring simple).
-    - Drops & recreates all tables each test for isolation.
-    - Seeds a minimal, realistic test dataset.
-    - Monkeypatches render_template so HTML routes don't require actual templates.
+    - Runs against the app's in-memory SQLite test database (FLASK_TESTING=1).
+    - Creates the schema and seeds a minimal, realistic dataset ONCE per session.
+    - Per-test isolation comes from `app_ctx`, which rolls each test back.
     """
-    with app.app_context():
+    with app.app_context(), pytest.MonkeyPatch.context() as mp:
+        # The fixture owns the seed data; keep create_tables() from adding
+        # the sample roster if app code calls it mid-session.
+        mp.setattr(appmod, "create_tables", lambda: None)
+
+        engine = db.engine
+
+        in_memory = engine.url.database in (None, "", ":memory:")
+
+        # pysqlite defers BEGIN until the first DML statement, which breaks
+        # SAVEPOINT-based rollback. Let SQLAlchemy emit BEGIN itself instead.
+        def _no_driver_autobegin(dbapi_conn, _record):
+            dbapi_conn.isolation_level = None
+
+        # Relax durability: nothing written by the tests needs to survive a crash.
+        def _relax_sqlite_durability(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            if in_memory:
+                cursor.execute("PRAGMA locking_mode=EXCLUSIVE")
+            else:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+
+        def _emit_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        event.listen(engine, "connect", _no_driver_autobegin)
+        event.listen(engine, "connect", _relax_sqlite_durability)
+        event.listen(engine, "begin", _emit_begin)
+        engine.dispose()  # drop pooled connections opened before the hooks
+
         # Clean slate
         db.drop_all()
         db.create_all()
 
-        # Disable first-request auto-seeding by ensuring at least 1 employee exists
-        # (so appmod.create_tables will skip).
-        # Then we'll reset to our precise seed below.
-        tmp_emp = Employee(name="SEED_SKIP", email="seed_skip@localhost")
-        db.session.add(tmp_emp)
-        db.session.commit()
-
-        # Now reset to our exact seed set
-        db.session.query(Schedule).delete()
-        db.session.query(TimeOffRequest).delete()
-        db.session.query(ShiftTrade).delete()
-        db.session.query(Employee).delete()
-        db.session.commit()
-
-        # Seed realistic employees
+        # Seed realistic employees with a single bulk INSERT
         emps = [
             # name, email, is_lead, nights_only, hours, special, pref
             ("Patty Golden", "patty@test.com", True,  False, 60, "LEAD",  "DAY"),
@@ -73,21 +100,56 @@ def app_ctx(monkeypatch):
             ("Lisa Dixon", "lisa@test.com", False, False, 40, None, "BOTH"),
             ("Dan Smith", "dan@test.com", False, False, 40, None, "BOTH"),
         ]
-        for n, e, lead, night, hrs, spec, pref in emps:
-            db.session.add(Employee(
-                name=n, email=e, is_lead=lead, nights_only=night,
-                max_hours_per_week=hrs, special_schedule=spec, shift_preference=pref
-            ))
+        rows = [
+            {
+                "name": n, "email": e, "is_lead": lead, "nights_only": night,
+                "max_hours_per_week": hrs, "special_schedule": spec, "shift_preference": pref,
+            }
+            for n, e, lead, night, hrs, spec, pref in emps
+        ]
+        db.session.execute(insert(Employee), rows)
         db.session.commit()
 
-        # Patch render_template so HTML routes don't fail without templates
-        monkeypatch.setattr(appmod, "render_template", lambda *a, **k: "<html>OK</html>")
-
-        yield  # tests run here
+        yield  # whole test session runs here
 
-        # Clean up after each test
+        # Clean up once at the end of the session
         db.session.remove()
         db.drop_all()
+        event.remove(engine, "connect", _no_driver_autobegin)
+        event.remove(engine, "connect", _relax_sqlite_durability)
+        event.remove(engine, "begin", _emit_begin)
+        engine.dispose()
+
+
+@pytest.fixture
+def app_ctx(app_session):
+    """
+    Wraps each test in an outer transaction that is rolled back afterwards.
+
+    App code still calls db.session.commit(); with
+    join_transaction_mode="create_savepoint" those commits only release a
+    SAVEPOINT, so the seeded data is restored without rebuilding the schema.
+    """
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    app_scoped_session = db.session
+    db.session = scoped_session(
+        sessionmaker(bind=connection, join_transaction_mode="create_savepoint"),
+        scopefunc=app_scoped_session.registry.scopefunc,
+    )
+
+    yield  # tests run here
+
+    db.session.remove()
+    db.session = app_scoped_session
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(autouse=True)
+def _stub_render_template(monkeypatch):
+    # Patch render_template so HTML routes don't fail without templates
+    monkeypatch.setattr(appmod, "render_template", lambda *a, **k: "<html>OK</html>")
 
 
 @pytest.fixture
@@ -95,6 +157,12 @@ def client(app_ctx):
     return app.test_client()
 
 
+@pytest.fixture(scope="session")
+def client_session(app_session):
+    # Shared client for tests that never write to the DB (no per-test rollback)
+    return app.test_client()
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -105,16 +173,35 @@ def next_week_monday(base: date | None = None) -> date:
 
 
 def json_ok(resp):
-    return resp.status_code == 200 and resp.is_json and resp.json.get("success") is True
+    payload = resp.get_json(silent=True)
+    return resp.status_code == 200 and payload is not None and payload.get("success") is True
+
+
+@pytest.fixture(scope="session")
+def weekly_schedule(client_session):
+    """
+    One week of schedule generated (and committed) once for the session.
+    Read-only consumers share it; tests that mutate it run inside `client`'s
+    rollback, so the next test sees it unchanged.
+    """
+    start_monday = next_week_monday()
+    r = client_session.post("/api/schedule/generate", json={
+        "start_date": start_monday.isoformat(),
+        "weeks": 1
+    })
+    body = r.get_json(silent=True)
+    assert r.status_code == 200 and body is not None, f"Schedule generation HTTP failed: {r.data}"
+    assert body.get("success") is True, f"Schedule generation failed: {body}"
+    return body
 
 
 # ---------------------------------------------------------------------------
 # Smoke test: HTML page routes (render_template is monkeypatched)
 # ---------------------------------------------------------------------------
 @pytest.mark.parametrize("route", ["/", "/dashboard", "/schedule", "/employees", "/timeoff", "/shift-trades", "/rules"])
-def test_page_routes_200(client, route, caplog):
+def test_page_routes_200(client_session, route, caplog):
     caplog.set_level(logging.INFO)
-    r = client.get(route)
+    r = client_session.get(route)
     assert r.status_code == 200, f"Route {route} should serve 200"
 
 
@@ -126,8 +213,9 @@ def test_employees_crud_flow(client, caplog):
 
     # Initial list (from seed)
     r = client.get("/api/employees")
-    assert json_ok(r), f"/api/employees GET failed: {r.json}"
-    seed_count = r.json["count"]
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"/api/employees GET failed: {body}"
+    seed_count = body["count"]
     assert seed_count >= 6
 
     # Create new employee via API
@@ -142,8 +230,9 @@ def test_employees_crud_flow(client, caplog):
         "min_rest_hours": 10
     }
     r = client.post("/api/employees", json=payload)
-    assert r.status_code == 201 and r.json.get("success") is True, f"Create employee failed: {r.json}"
-    new_emp = r.json["employee"]
+    body = r.get_json(silent=True)
+    assert r.status_code == 201 and body.get("success") is True, f"Create employee failed: {body}"
+    new_emp = body["employee"]
     assert new_emp["email"] == "alex@test.com"
     assert new_emp["max_hours_per_week"] == 32
     assert new_emp["shift_preference"] == "BOTH"
@@ -155,8 +244,9 @@ def test_employees_crud_flow(client, caplog):
         "special_schedule": "LEAD"    # should set is_lead True
     }
     r = client.put(f"/api/employees/{new_emp['id']}", json=update_payload)
-    assert json_ok(r), f"Update employee failed: {r.json}"
-    updated = r.json["employee"]
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Update employee failed: {body}"
+    updated = body["employee"]
     assert updated["max_hours_per_week"] == 36
     assert updated["shift_preference"] == "DAY"
     assert updated["is_lead"] is True
@@ -164,12 +254,14 @@ def test_employees_crud_flow(client, caplog):
 
     # Deactivate employee
     r = client.delete(f"/api/employees/{new_emp['id']}")
-    assert json_ok(r), f"Deactivate employee failed: {r.json}"
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Deactivate employee failed: {body}"
 
     # Ensure deactivated employee no longer comes back in active list
     r = client.get("/api/employees")
-    assert json_ok(r), f"/api/employees after delete failed: {r.json}"
-    emails = [e["email"] for e in r.json["employees"]]
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"/api/employees after delete failed: {body}"
+    emails = [e["email"] for e in body["employees"]]
     assert "alex@test.com" not in emails
 
 
@@ -195,33 +287,32 @@ def test_timeoff_and_generation_respects_pto(client, caplog):
         "shift_type": "DAY",
         "reason": "Test PTO"
     })
-    assert r.status_code == 201 and r.json.get("success"), f"Create PTO failed: {r.json}"
-    pto_id = r.json["request"]["id"]
+    body = r.get_json(silent=True)
+    assert r.status_code == 201 and body.get("success"), f"Create PTO failed: {body}"
+    pto_id = body["request"]["id"]
 
     # Approve the PTO
     r = client.put(f"/api/timeoff/{pto_id}/approve")
-    assert json_ok(r), f"PTO approve failed: {r.json}"
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"PTO approve failed: {body}"
 
     # Generate 1 week schedule that includes the PTO date
     r = client.post("/api/schedule/generate", json={
         "start_date": start_monday.isoformat(),
         "weeks": 1
     })
-
-    # NOTE: If this test fails HERE with 500 and a message referencing
-    # `_assign_shifts_with_fair_distribution`, your agent needs to fix the
-    # function to use the `available_employees` parameter instead of
-    # undefined `available_day_employees`/`available_night_employees`.
-    assert r.status_code == 200 and r.is_json, f"Schedule generation HTTP failed: {r.data}"
-    assert r.json.get("success") is True, f"Schedule generation failed: {r.json}"
+    body = r.get_json(silent=True)
+    assert r.status_code == 200 and body is not None, f"Schedule generation HTTP failed: {r.data}"
+    assert body.get("success") is True, f"Schedule generation failed: {body}"
 
     # Fetch that day’s schedule
     r = client.get("/api/schedule", query_string={
         "start_date": pto_day.isoformat(),
         "end_date": pto_day.isoformat(),
     })
-    assert json_ok(r), f"Get schedule failed: {r.json}"
-    day_sched = r.json["schedules"]
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Get schedule failed: {body}"
+    day_sched = body["schedules"]
 
     # Ensure the PTO employee is NOT assigned any DAY shift that date
     illegal = [
@@ -236,26 +327,20 @@ def test_timeoff_and_generation_respects_pto(client, caplog):
 # ---------------------------------------------------------------------------
 # Shift Trades flow: create trade, approve, verify swap in DB
 # ---------------------------------------------------------------------------
-def test_shift_trades_flow(client, caplog):
+def test_shift_trades_flow(weekly_schedule, client, caplog):
     caplog.set_level(logging.INFO)
 
+    # weekly_schedule guarantees there are shifts to trade
     start_monday = next_week_monday()
 
-    # Generate 1 week schedule to ensure there are shifts to trade
-    r = client.post("/api/schedule/generate", json={
-        "start_date": start_monday.isoformat(),
-        "weeks": 1
-    })
-    assert r.status_code == 200 and r.is_json, f"Schedule generation HTTP failed: {r.data}"
-    assert r.json.get("success") is True, f"Schedule generation failed: {r.json}"
-
     # Pull all schedule for the week, pick two different employees' shifts on 2 different days
     r = client.get("/api/schedule", query_string={
         "start_date": start_monday.isoformat(),
         "end_date": (start_monday + timedelta(days=6)).isoformat()
     })
-    assert json_ok(r), f"Fetching schedule failed: {r.json}"
-    full = r.json["schedules"]
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Fetching schedule failed: {body}"
+    full = body["schedules"]
     assert len(full) > 0, "No shifts generated to trade"
 
     # Pick two distinct shifts with different employees
@@ -285,12 +370,14 @@ def test_shift_trades_flow(client, caplog):
         "trade_schedule_id": trade_schedule_id,
         "trade_reason": "Coverage swap test"
     })
-    assert r.status_code == 201 and r.json.get("success") is True, f"Create trade failed: {r.json}"
-    trade_id = r.json["trade"]["id"]
+    body = r.get_json(silent=True)
+    assert r.status_code == 201 and body.get("success") is True, f"Create trade failed: {body}"
+    trade_id = body["trade"]["id"]
 
     # Approve the trade (this should swap employee_ids for those two schedule rows)
     r = client.put(f"/api/trades/{trade_id}/approve")
-    assert json_ok(r), f"Approve trade failed: {r.json}"
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Approve trade failed: {body}"
 
     # Verify in DB the swap occurred
     with app.app_context():
@@ -309,7 +396,7 @@ def test_shift_trades_flow(client, caplog):
 # ---------------------------------------------------------------------------
 # Get upcoming shifts for an employee
 # ---------------------------------------------------------------------------
-def test_get_employee_shifts_endpoint(client, caplog):
+def test_get_employee_shifts_endpoint(weekly_schedule, client, caplog):
     caplog.set_level(logging.INFO)
 
     # pick an existing employee
@@ -317,18 +404,110 @@ def test_get_employee_shifts_endpoint(client, caplog):
         any_emp = Employee.query.filter_by(active=True).first()
         assert any_emp is not None
 
+    # weekly_schedule covers this window
     start_monday = next_week_monday()
-    # Ensure schedule exists for the window
-    r = client.post("/api/schedule/generate", json={
-        "start_date": start_monday.isoformat(),
-        "weeks": 1
-    })
-    assert r.status_code == 200 and r.is_json, f"Schedule generation HTTP failed: {r.data}"
-    assert r.json.get("success") is True, f"Schedule generation failed: {r.json}"
 
     r = client.get(f"/api/employees/{any_emp.id}/shifts", query_string={
         "start_date": start_monday.isoformat(),
         "end_date": (start_monday + timedelta(days=14)).isoformat()
     })
-    assert json_ok(r), f"Get employee shifts failed: {r.json}"
-    assert isinstance(r.json.get("shifts"), list)
+    body = r.get_json(silent=True)
+    assert json_ok(r), f"Get employee shifts failed: {body}"
+    assert isinstance(body.get("shifts"), list)
+
+
+# ---------------------------------------------------------------------------
+# Standalone scheduling engine: LEGAL_CAP weekly hours
+# ---------------------------------------------------------------------------
+def test_engine_legal_cap_weekly_hours(caplog):
+    caplog.set_level(logging.INFO)
+
+    # Same shape as the init_db() sample roster; rows are passed in directly
+    roster = [
+        # name, shift_type, hours_per_week, special_schedule
+        ("Patty Golden", "DAY", 60, "LEAD"),
+        ("Nicole Dempster", "NIGHT", 30, None),
+        ("Vicki Theler", "BOTH", 20, "LEGAL_CAP"),
+        ("Mayra Bradley", "BOTH", 40, None),
+        ("Lisa Dixon", "BOTH", 40, None),
+        ("Shala Johnson", "BOTH", 40, None),
+        ("Chloe Gray", "BOTH", 40, None),
+        ("Tash Jaramillo", "BOTH", 40, None),
+        ("NewHire A", "BOTH", 40, "NEW_HIRE"),
+    ]
+    employees = [
+        {
+            "id": i, "name": n, "shift_type": st, "hours_per_week": hrs, "special_schedule": spec,
+            "cannot_work_days": None, "max_consecutive_days": 5, "min_rest_hours": 10,
+        }
+        for i, (n, st, hrs, spec) in enumerate(roster, start=1)
+    ]
+
+    start_monday = datetime(2025, 10, 6)
+    schedule = SchedulingEngine().generate_schedule(start_monday, 1, employees=employees)
+    assert schedule, "Engine generated no shifts"
+
+    worked = {}
+    for s in schedule:
+        worked[s["employee_id"]] = worked.get(s["employee_id"], 0) + s["hours"]
+
+    for emp in employees:
+        if emp["special_schedule"] == "LEGAL_CAP":
+            assert worked.get(emp["id"], 0) <= emp["hours_per_week"], (
+                f"{emp['name']} worked {worked[emp['id']]}h, cap is {emp['hours_per_week']}h"
+            )
+
+
+# ---------------------------------------------------------------------------
+# Standalone scheduling engine: persist() bulk insert
+# ---------------------------------------------------------------------------
+def _persisted_rows():
+    conn = database.get_db_connection()
+    rows = conn.execute(
+        "SELECT employee_id, schedule_date, shift_start, shift_end, shift_type, role, is_overtime "
+        "FROM schedules ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return [tuple(r) for r in rows]
+
+
+@pytest.fixture
+def engine_db(tmp_path, monkeypatch):
+    # database.get_db_connection() opens hospital_scheduling.db in the cwd
+    monkeypatch.chdir(tmp_path)
+    database.init_db()
+    return SchedulingEngine()
+
+
+def test_engine_persist_rows_and_columnar(engine_db, monkeypatch):
+    # Small batches so the executemany chunking is exercised too
+    monkeypatch.setattr(scheduling_engine, "PERSIST_BATCH_SIZE", 7)
+    start_monday = datetime(2025, 10, 6)
+
+    rows = engine_db.generate_schedule(start_monday, 1)
+    assert rows, "Engine generated no shifts"
+    expected = [
+        (r["employee_id"], r["date"], r["start_time"], r["end_time"], r["shift_type"], r["role"], int(r["is_overtime"]))
+        for r in rows
+    ]
+
+    assert engine_db.persist(rows) == len(rows)
+    assert _persisted_rows() == expected
+
+    # The columnar form of the same schedule writes the same rows again
+    columns = engine_db.generate_schedule(start_monday, 1, columnar=True)
+    assert engine_db.persist(columns) == len(rows)
+    assert _persisted_rows() == expected * 2
+
+
+def test_engine_persist_rolls_back_failed_insert(engine_db, monkeypatch):
+    monkeypatch.setattr(scheduling_engine, "PERSIST_BATCH_SIZE", 7)
+    columns = engine_db.generate_schedule(datetime(2025, 10, 6), 1, columnar=True)
+    assert len(columns["date"]) > 7, "need more than one batch before the failure"
+
+    # schedule_date is NOT NULL: the last batch fails after earlier ones ran
+    columns["date"][-1] = None
+    with pytest.raises(sqlite3.IntegrityError):
+        engine_db.persist(columns)
+
+    assert _persisted_rows() == []
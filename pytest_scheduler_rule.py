@@ -0,0 +1,395 @@
+# API tests for app_fixed_rule.py (run: python -m pytest -q pytest_scheduler_rule.py)
+import os
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+
+import pytest
+from sqlalchemy import update
+
+# FLASK_TESTING must be set first: the app picks its (in-memory) test database
+# when it is imported.
+os.environ.setdefault("FLASK_TESTING", "1")
+import app_fixed_rule as appmod
+from app_fixed_rule import app, db, Employee, Schedule, TimeOffRequest, ShiftTrade
+
+# ---------------------------------------------------------------------------
+# Pytest fixtures: fresh in-memory schema per test, seeded data, test client
+# ---------------------------------------------------------------------------
+@pytest.fixture
+def seeded():
+    """
+    Rebuilds the in-memory schema for every test and seeds two employees
+    with two future shifts each. Returns the ids tests build on.
+
+    Unlike pytest_scheduler.py there is no session-wide seed with per-test
+    SAVEPOINT rollback: the trade swap worker runs on its own thread with
+    its own session and needs real commits, which a rolled-back outer
+    transaction would hide from it (and it from the test). Rebuilding the
+    in-memory schema is cheap enough to do per test instead.
+    """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        alice = Employee(name="Mayra Bradley", email="mayra@test.com", shift_preference="BOTH")
+        bob = Employee(name="Lisa Dixon", email="lisa@test.com", shift_preference="BOTH")
+        db.session.add_all([alice, bob])
+        db.session.flush()
+
+        day = date.today() + timedelta(days=7)
+        shifts = [
+            Schedule(employee_id=emp.id, schedule_date=day + timedelta(days=offset),
+                     shift_start=time(7, 0), shift_end=time(19, 0), shift_type="DAY", role="D1")
+            for emp in (alice, bob)
+            for offset in (0, 1)
+        ]
+        db.session.add_all(shifts)
+        db.session.commit()
+
+        yield {
+            "employees": (alice.id, bob.id),
+            "schedules": [s.id for s in shifts],
+        }
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(seeded):
+    return app.test_client()
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def add_timeoff(employee_id, status="PENDING"):
+    day = date.today() + timedelta(days=30)
+    req = TimeOffRequest(employee_id=employee_id, start_date=day, end_date=day, status=status)
+    db.session.add(req)
+    db.session.commit()
+    return req.id
+
+
+def add_trade(seeded, status="PENDING"):
+    alice, bob = seeded["employees"]
+    a1, a2, b1, b2 = seeded["schedules"]
+    trade = ShiftTrade(requesting_employee_id=alice, target_employee_id=bob,
+                       original_schedule_id=a1, trade_schedule_id=b1, status=status)
+    db.session.add(trade)
+    db.session.commit()
+    return trade.id
+
+
+def statuses(model, ids):
+    db.session.expire_all()
+    return [db.session.get(model, i).status for i in ids]
+
+
+# ---------------------------------------------------------------------------
+# Bulk time off approval / trade denial
+# ---------------------------------------------------------------------------
+def test_bulk_approve_timeoff_only_touches_pending(seeded, client):
+    alice, _ = seeded["employees"]
+    pending = [add_timeoff(alice), add_timeoff(alice)]
+    denied = add_timeoff(alice, status="DENIED")
+
+    r = client.post("/api/timeoff/bulk-approve", json={"ids": pending + [denied, 9999]})
+    body = r.get_json(silent=True)
+    assert r.status_code == 200 and body["success"] is True, f"Bulk approve failed: {body}"
+    assert body["updated_count"] == 2
+
+    assert statuses(TimeOffRequest, pending + [denied]) == ["APPROVED", "APPROVED", "DENIED"]
+
+
+def test_bulk_deny_trades_only_touches_pending(seeded, client):
+    pending = [add_trade(seeded), add_trade(seeded)]
+    approved = add_trade(seeded, status="APPROVED")
+
+    # numeric strings are accepted, as for POST /api/trades
+    r = client.post("/api/trades/bulk-deny", json={"ids": [str(pending[0]), pending[1], approved]})
+    body = r.get_json(silent=True)
+    assert r.status_code == 200 and body["success"] is True, f"Bulk deny failed: {body}"
+    assert body["updated_count"] == 2
+
+    assert statuses(ShiftTrade, pending + [approved]) == ["DENIED", "DENIED", "APPROVED"]
+
+
+@pytest.mark.parametrize("route", ["/api/timeoff/bulk-approve", "/api/trades/bulk-deny"])
+@pytest.mark.parametrize("payload", [
+    [1, 2],              # JSON array instead of an object
+    {},
+    {"ids": []},
+    {"ids": "1"},
+    {"ids": [1.9]},
+    {"ids": [True]},
+    {"ids": [1, None]},
+    {"ids": ["²"]},      # Unicode digit: isdigit() but not int()-parsable
+])
+def test_bulk_endpoints_reject_malformed_ids(client, route, payload):
+    r = client.post(route, json=payload)
+    body = r.get_json(silent=True)
+    assert r.status_code == 400 and body["success"] is False, f"{route} accepted {payload!r}: {body}"
+
+
+def test_bulk_endpoints_reject_non_json_body(client):
+    r = client.post("/api/timeoff/bulk-approve", data="ids=1", content_type="text/plain")
+    assert r.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Shift trade listing
+# ---------------------------------------------------------------------------
+def test_trade_listing_matches_create_response_and_tracks_renames(seeded, client):
+    alice, bob = seeded["employees"]
+    a1, a2, b1, b2 = seeded["schedules"]
+
+    r = client.post("/api/trades", json={
+        "requesting_employee_id": alice, "target_employee_id": bob,
+        "original_schedule_id": a1, "trade_schedule_id": b1,
+    })
+    body = r.get_json(silent=True)
+    assert r.status_code == 201 and body["success"] is True, f"Create trade failed: {body}"
+    created = body["trade"]
+
+    # GET builds rows from a column select; it must agree with to_dict()
+    listed = client.get("/api/trades").get_json()["trades"]
+    assert listed == [created]
+
+    r = client.put(f"/api/employees/{bob}", json={"name": "Lisa Dixon-Gray"})
+    assert r.status_code == 200
+
+    listed = client.get("/api/trades").get_json()["trades"]
+    assert listed[0]["target_employee_name"] == "Lisa Dixon-Gray"
+
+
+TRADE_FIELDS = ("requesting_employee_id", "target_employee_id", "original_schedule_id", "trade_schedule_id")
+
+
+def trade_payload(seeded, **overrides):
+    alice, bob = seeded["employees"]
+    a1, a2, b1, b2 = seeded["schedules"]
+    payload = dict(zip(TRADE_FIELDS, (alice, bob, a1, b1)))
+    payload.update(overrides)
+    return payload
+
+
+@pytest.mark.parametrize("field", TRADE_FIELDS)
+@pytest.mark.parametrize("bad", [None, True, 1.9, "²", "abc"])
+def test_create_trade_rejects_bad_id_fields(seeded, client, field, bad):
+    payload = trade_payload(seeded, **{field: bad})
+    if bad is None:
+        del payload[field]  # missing entirely
+
+    r = client.post("/api/trades", json=payload)
+    body = r.get_json(silent=True)
+    assert r.status_code == 400, f"POST /api/trades accepted {field}={bad!r}: {body}"
+    assert body["error"] == f"{field} is required and must be an integer"
+
+
+def test_create_trade_accepts_numeric_string_ids(seeded, client):
+    payload = {k: str(v) for k, v in trade_payload(seeded).items()}
+    r = client.post("/api/trades", json=payload)
+    body = r.get_json(silent=True)
+    assert r.status_code == 201 and body["success"] is True, f"Create trade failed: {body}"
+
+
+@pytest.mark.parametrize("body_json", [[1, 2], "trade", None])
+def test_create_trade_rejects_non_object_body(client, body_json):
+    r = client.post("/api/trades", json=body_json)
+    body = r.get_json(silent=True)
+    assert r.status_code == 400
+    assert body["error"] == "Request body must be a JSON object"
+
+
+def test_create_trade_rejects_non_string_reason(seeded, client):
+    r = client.post("/api/trades", json=trade_payload(seeded, trade_reason=42))
+    body = r.get_json(silent=True)
+    assert r.status_code == 400
+    assert body["error"] == "trade_reason must be a string"
+
+
+# ---------------------------------------------------------------------------
+# Single-flight coalescing of concurrent GETs
+# ---------------------------------------------------------------------------
+def wait_until(predicate, timeout=5.0):
+    deadline = _time.monotonic() + timeout
+    while not predicate():
+        assert _time.monotonic() < deadline, "timed out waiting for condition"
+        _time.sleep(0.001)
+
+
+@pytest.fixture
+def blocked_leader():
+    """
+    Starts a leader for a key whose loader blocks until released, so
+    followers arriving meanwhile find it in flight. Yields
+    (start, release); start(key, loader_result) returns the leader's future.
+    """
+    release = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=8)
+
+    def start(key, result):
+        def loader():
+            release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        future = pool.submit(appmod._single_flight, key, loader)
+        wait_until(lambda: key in appmod._inflight)
+        return future
+
+    yield start, release
+    release.set()
+    pool.shutdown(wait=True)
+    assert appmod._inflight == {}, f"_inflight not cleaned up: {appmod._inflight}"
+
+
+def test_single_flight_runs_loader_once_for_concurrent_callers(blocked_leader, monkeypatch):
+    start, release = blocked_leader
+    monkeypatch.setattr(appmod, "SINGLE_FLIGHT_TIMEOUT", 5)
+    follower_loads = []
+
+    def follower_loader():
+        follower_loads.append(1)
+        return ["own"]
+
+    leader = start("k", ["shared"])
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        followers = [pool.submit(appmod._single_flight, "k", follower_loader) for _ in range(4)]
+        _time.sleep(0.05)  # let the followers reach the in-flight future
+        release.set()
+        results = [f.result(timeout=5) for f in followers]
+
+    assert leader.result(timeout=5) == ["shared"]
+    assert results == [["shared"]] * 4
+    assert follower_loads == []
+    assert appmod._inflight == {}
+
+
+def test_single_flight_leader_exception_reaches_waiters(blocked_leader, monkeypatch):
+    start, release = blocked_leader
+    monkeypatch.setattr(appmod, "SINGLE_FLIGHT_TIMEOUT", 5)
+
+    leader = start("k", RuntimeError("db down"))
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        followers = [pool.submit(appmod._single_flight, "k", lambda: "own") for _ in range(2)]
+        _time.sleep(0.05)
+        release.set()
+        for f in followers + [leader]:
+            with pytest.raises(RuntimeError, match="db down"):
+                f.result(timeout=5)
+
+    assert appmod._inflight == {}
+
+
+def test_single_flight_follower_falls_back_after_timeout(blocked_leader, monkeypatch):
+    start, release = blocked_leader
+    monkeypatch.setattr(appmod, "SINGLE_FLIGHT_TIMEOUT", 0.05)
+
+    leader = start("k", "shared")
+    # The leader is still blocked, so the follower gives up and loads itself
+    assert appmod._single_flight("k", lambda: "own") == "own"
+
+    release.set()
+    assert leader.result(timeout=5) == "shared"
+    wait_until(lambda: appmod._inflight == {})
+
+
+def test_single_flight_keys_do_not_share(blocked_leader):
+    start, release = blocked_leader
+    start("a", "shared")
+    # A different key is never coalesced with the blocked one
+    assert appmod._single_flight("b", lambda: "own") == "own"
+
+
+# ---------------------------------------------------------------------------
+# Trade approval: the swap runs on the background worker
+# ---------------------------------------------------------------------------
+def owners(schedule_ids):
+    db.session.expire_all()
+    return [db.session.get(Schedule, i).employee_id for i in schedule_ids]
+
+
+def test_approve_trade_swaps_on_worker(seeded, client):
+    alice, bob = seeded["employees"]
+    a1, a2, b1, b2 = seeded["schedules"]
+    trade_id = add_trade(seeded)
+
+    r = client.put(f"/api/trades/{trade_id}/approve")
+    body = r.get_json(silent=True)
+    assert r.status_code == 202 and body["status"] == "APPROVING", f"Approve failed: {body}"
+
+    appmod._trade_swap_queue.join()  # wait for the worker to finish the swap
+
+    assert statuses(ShiftTrade, [trade_id]) == ["APPROVED"]
+    assert owners([a1, b1]) == [bob, alice]
+
+    # Approving twice is refused; nothing is swapped back
+    assert client.put(f"/api/trades/{trade_id}/approve").status_code == 400
+    appmod._trade_swap_queue.join()
+    assert owners([a1, b1]) == [bob, alice]
+
+
+@pytest.mark.parametrize("status", ["APPROVING", "APPROVED"])
+def test_deny_refuses_claimed_trades(seeded, client, status):
+    trade_id = add_trade(seeded, status=status)
+
+    r = client.put(f"/api/trades/{trade_id}/deny")
+    assert r.status_code == 400
+    assert statuses(ShiftTrade, [trade_id]) == [status]
+
+
+def test_swap_loses_to_status_change_after_read(seeded, client, monkeypatch):
+    a1, a2, b1, b2 = seeded["schedules"]
+    trade_id = add_trade(seeded, status="APPROVING")
+
+    # The trade is denied by another writer right after the worker read it
+    real_get = db.session.get
+
+    def get_then_deny(model, ident, **kw):
+        obj = real_get(model, ident, **kw)
+        with db.engine.begin() as conn:
+            conn.execute(update(ShiftTrade).where(ShiftTrade.id == trade_id).values(status="DENIED"))
+        return obj
+
+    monkeypatch.setattr(db.session, "get", get_then_deny)
+    assert appmod._swap_trade_shifts(trade_id) is False
+    monkeypatch.undo()
+
+    assert statuses(ShiftTrade, [trade_id]) == ["DENIED"]
+    assert owners([a1, b1]) == list(seeded["employees"])
+
+
+def test_requeue_approving_trades_after_restart(seeded, client):
+    alice, bob = seeded["employees"]
+    a1, a2, b1, b2 = seeded["schedules"]
+    # Claimed by a process that stopped before its worker swapped the shifts
+    stuck = add_trade(seeded, status="APPROVING")
+    pending = add_trade(seeded)
+
+    assert appmod._requeue_approving_trades() == 1
+    appmod._trade_swap_queue.join()
+
+    assert statuses(ShiftTrade, [stuck, pending]) == ["APPROVED", "PENDING"]
+    assert owners([a1, b1]) == [bob, alice]
+
+
+# ---------------------------------------------------------------------------
+# Single deny endpoints
+# ---------------------------------------------------------------------------
+def test_deny_unknown_ids_404(client):
+    assert client.put("/api/timeoff/9999/deny").status_code == 404
+    assert client.put("/api/trades/9999/deny").status_code == 404
+
+
+def test_deny_timeoff(seeded, client):
+    alice, _ = seeded["employees"]
+    req_id = add_timeoff(alice)
+
+    r = client.put(f"/api/timeoff/{req_id}/deny")
+    body = r.get_json(silent=True)
+    assert r.status_code == 200 and body["success"] is True, f"Deny failed: {body}"
+    assert statuses(TimeOffRequest, [req_id]) == ["DENIED"]
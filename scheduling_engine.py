@@ -1,161 +1,356 @@
 from datetime import datetime, timedelta, time
-from collections import defaultdict
+from collections import namedtuple
+import heapq
 import json
 from database import get_db_connection
 
+PERSIST_BATCH_SIZE = 10000
+
+# Static shift definition; the HH:MM strings and the end time as fractional
+# hours are computed once, not per assignment
+ShiftDef = namedtuple('ShiftDef', ['role', 'start_time', 'end_time', 'hours', 'start_str', 'end_str', 'end_hours'])
+
+def shift_def(role, start_time, end_time, hours):
+    return ShiftDef(role, start_time, end_time, hours,
+                    start_time.strftime('%H:%M'), end_time.strftime('%H:%M'),
+                    end_time.hour + end_time.minute / 60)
+
+# Keys of each generated schedule row, in column order
+SCHEDULE_COLUMNS = ('employee_id', 'employee_name', 'date', 'shift_type', 'role',
+                    'start_time', 'end_time', 'hours', 'is_overtime')
+
+# cannot_work_days codes -> date.weekday() bit positions
+WEEKDAY_BITS = {'Mon': 0, 'Tue': 1, 'Wed': 2, 'Thu': 3, 'Fri': 4, 'Sat': 5, 'Sun': 6}
+
+def _filter_day_candidates(candidates, day_start, last_shift_end, consecutive_days, week_hours,
+                           min_rest_hours, max_consecutive_days, weekly_cap):
+    """Per-day availability kernel over flat numeric sequences.
+    
+    `candidates` holds (position, day_ok, night_ok) for employees that passed
+    the static checks; returns (day positions, night positions). The other
+    arguments are plain per-position lists, so the loop never touches rows,
+    dicts or datetimes. The per-shift LEGAL_CAP check happens in assign_shifts.
+    """
+    day_available = []
+    night_available = []
+    
+    for i, day_ok, night_ok in candidates:
+        # Check rest period
+        if day_start - last_shift_end[i] < min_rest_hours[i]:
+            continue
+        
+        # Check consecutive days
+        if consecutive_days[i] >= max_consecutive_days[i]:
+            continue
+        
+        # Check special schedules
+        if week_hours[i] >= weekly_cap[i]:
+            continue
+        
+        if day_ok:
+            day_available.append(i)
+        if night_ok:
+            night_available.append(i)
+    
+    return day_available, night_available
+
 class SchedulingEngine:
     def __init__(self):
         self.day_shifts = {
             'weekday': [
-                ('D1', time(7, 0), time(19, 0), 12),
-                ('D2', time(7, 0), time(19, 0), 12),
-                ('D3', time(7, 0), time(19, 0), 12),
-                ('PATTY', time(8, 0), time(16, 0), 8),
-                ('EARLY1', time(7, 0), time(8, 0), 1),
-                ('LATE3', time(16, 0), time(19, 0), 3)
+                shift_def('D1', time(7, 0), time(19, 0), 12),
+                shift_def('D2', time(7, 0), time(19, 0), 12),
+                shift_def('D3', time(7, 0), time(19, 0), 12),
+                shift_def('PATTY', time(8, 0), time(16, 0), 8),
+                shift_def('EARLY1', time(7, 0), time(8, 0), 1),
+                shift_def('LATE3', time(16, 0), time(19, 0), 3)
             ],
             'weekend': [
-                ('D1', time(7, 0), time(19, 0), 12),
-                ('D2', time(7, 0), time(19, 0), 12),
-                ('D3', time(7, 0), time(19, 0), 12),
-                ('D4', time(7, 0), time(19, 0), 12)
+                shift_def('D1', time(7, 0), time(19, 0), 12),
+                shift_def('D2', time(7, 0), time(19, 0), 12),
+                shift_def('D3', time(7, 0), time(19, 0), 12),
+                shift_def('D4', time(7, 0), time(19, 0), 12)
             ]
         }
         
         self.night_shifts = [
-            ('N1', time(19, 0), time(5, 30), 10.5),
-            ('N2', time(21, 30), time(8, 0), 10.5),
-            ('N3', time(19, 0), time(7, 0), 12)
+            shift_def('N1', time(19, 0), time(5, 30), 10.5),
+            shift_def('N2', time(21, 30), time(8, 0), 10.5),
+            shift_def('N3', time(19, 0), time(7, 0), 12)
         ]
         
-    def generate_schedule(self, start_date, weeks=4):
-        """Generate schedule for specified number of weeks"""
-        conn = get_db_connection()
-        employees = conn.execute('SELECT * FROM employees WHERE active = 1').fetchall()
-        conn.close()
+        # Active roster, loaded on the first generate_schedule() call that
+        # doesn't pass one in
+        self._employees_cache = None
+        
+    def generate_schedule(self, start_date, weeks=4, employees=None, columnar=False):
+        """Generate schedule for specified number of weeks.
+        
+        Returns a list of row dicts, or with columnar=True a dict of parallel
+        lists keyed by SCHEDULE_COLUMNS.
+        """
+        if employees is None:
+            employees = self.load_employees()
+        
+        columns = self.build_employee_columns(employees)
         
-        schedule_data = []
+        # Output is collected column-wise and only turned into rows on return
+        schedule_data = {key: [] for key in SCHEDULE_COLUMNS}
+        out_employee_id = schedule_data['employee_id'].append
+        out_employee_name = schedule_data['employee_name'].append
+        out_date = schedule_data['date'].append
+        out_shift_type = schedule_data['shift_type'].append
+        out_role = schedule_data['role'].append
+        out_start_time = schedule_data['start_time'].append
+        out_end_time = schedule_data['end_time'].append
+        out_hours = schedule_data['hours'].append
+        out_is_overtime = schedule_data['is_overtime'].append
         current_date = start_date
         
-        # Initialize tracking variables
-        employee_hours = defaultdict(float)
-        last_shift_end = defaultdict(lambda: None)
-        consecutive_days = defaultdict(int)
+        # Initialize tracking variables, indexed by position in `employees`.
+        # last_shift_end is in hours since 0001-01-01 (date.toordinal() * 24),
+        # so the rest check is plain float arithmetic.
+        employee_count = len(employees)
+        employee_hours = [0.0] * employee_count
+        last_shift_end = [float('-inf')] * employee_count
+        consecutive_days = [0] * employee_count
         
         for week in range(weeks):
+            # LEGAL_CAP limits are per week
+            week_hours = [0.0] * employee_count
+            
             for day in range(7):
                 date = current_date + timedelta(days=day)
-                is_weekend = date.weekday() >= 5  # Saturday = 5, Sunday = 6
+                weekday = date.weekday()
+                is_weekend = weekday >= 5  # Saturday = 5, Sunday = 6
+                date_str = date.strftime('%Y-%m-%d')
+                day_start = date.toordinal() * 24.0
                 
                 # Get day shifts for this date
                 day_shifts = self.day_shifts['weekend'] if is_weekend else self.day_shifts['weekday']
                 
+                available_employees, available_night_employees = self.get_day_and_night_candidates(
+                    employees, date, last_shift_end, consecutive_days, week_hours, columns, weekday
+                )
+                
                 # Assign day shifts
-                available_employees = self.get_available_employees(employees, date, 'Day', last_shift_end, consecutive_days)
-                day_assignments = self.assign_shifts(day_shifts, available_employees, employee_hours, date, 'Day')
+                day_assignments = self.assign_shifts(day_shifts, available_employees, employee_hours, date, 'Day', employees, columns, week_hours)
+                # Both candidate lists were built before any shift today; record
+                # the day hours now so the night pass sees them against LEGAL_CAP
+                for assignment in day_assignments:
+                    week_hours[assignment['index']] += assignment['hours']
                 
                 # Assign night shifts
-                available_night_employees = self.get_available_employees(employees, date, 'Night', last_shift_end, consecutive_days)
-                night_assignments = self.assign_shifts(self.night_shifts, available_night_employees, employee_hours, date, 'Night')
+                night_assignments = self.assign_shifts(self.night_shifts, available_night_employees, employee_hours, date, 'Night', employees, columns, week_hours)
+                for assignment in night_assignments:
+                    week_hours[assignment['index']] += assignment['hours']
                 
                 # Save assignments and update tracking
                 all_assignments = day_assignments + night_assignments
                 for assignment in all_assignments:
-                    schedule_data.append({
-                        'employee_id': assignment['employee_id'],
-                        'employee_name': assignment['employee_name'],
-                        'date': date.strftime('%Y-%m-%d'),
-                        'shift_type': assignment['shift_type'],
-                        'role': assignment['role'],
-                        'start_time': assignment['start_time'].strftime('%H:%M'),
-                        'end_time': assignment['end_time'].strftime('%H:%M'),
-                        'hours': assignment['hours'],
-                        'is_overtime': employee_hours[assignment['employee_id']] > 40
-                    })
+                    i = assignment['index']
+                    out_employee_id(assignment['employee_id'])
+                    out_employee_name(assignment['employee_name'])
+                    out_date(date_str)
+                    out_shift_type(assignment['shift_type'])
+                    out_role(assignment['role'])
+                    out_start_time(assignment['start_str'])
+                    out_end_time(assignment['end_str'])
+                    out_hours(assignment['hours'])
+                    out_is_overtime(employee_hours[i] > 40)
                     
                     # Update tracking variables
-                    employee_id = assignment['employee_id']
-                    employee_hours[employee_id] += assignment['hours']
-                    last_shift_end[employee_id] = datetime.combine(date, assignment['end_time'])
-                    consecutive_days[employee_id] += 1
+                    employee_hours[i] += assignment['hours']
+                    last_shift_end[i] = day_start + assignment['end_hours']
+                    consecutive_days[i] += 1
                     
                     # Reset consecutive days if there's a gap
-                    self.update_consecutive_days(consecutive_days, employee_id, date)
+                    self.update_consecutive_days(consecutive_days, i, date)
                 
                 # Clear consecutive days for employees not working today
                 self.clear_non_working_days(consecutive_days, all_assignments)
         
-        return schedule_data
+        if columnar:
+            return schedule_data
+        return [dict(zip(SCHEDULE_COLUMNS, values)) for values in zip(*schedule_data.values())]
+    
+    def load_employees(self):
+        """Active employees, fetched once per engine instance"""
+        if self._employees_cache is None:
+            conn = get_db_connection()
+            self._employees_cache = conn.execute('SELECT * FROM employees WHERE active = 1').fetchall()
+            conn.close()
+        return self._employees_cache
     
-    def get_available_employees(self, employees, date, shift_type, last_shift_end, consecutive_days):
-        """Get employees available for a specific shift"""
-        available = []
+    def persist(self, schedule_data):
+        """Write generated rows (list of dicts or columnar) to the schedules table in a single transaction"""
+        if isinstance(schedule_data, dict):
+            rows = list(zip(
+                schedule_data['employee_id'],
+                schedule_data['date'],
+                schedule_data['start_time'],
+                schedule_data['end_time'],
+                schedule_data['shift_type'],
+                schedule_data['role'],
+                schedule_data['is_overtime']
+            ))
+        else:
+            rows = [
+                (
+                    entry['employee_id'],
+                    entry['date'],
+                    entry['start_time'],
+                    entry['end_time'],
+                    entry['shift_type'],
+                    entry['role'],
+                    entry['is_overtime']
+                )
+                for entry in schedule_data
+            ]
+        
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN')
+            for i in range(0, len(rows), PERSIST_BATCH_SIZE):
+                conn.executemany('''
+                    INSERT INTO schedules (employee_id, schedule_date, shift_start, shift_end, shift_type, role, is_overtime)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows[i:i + PERSIST_BATCH_SIZE])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return len(rows)
+    
+    def build_employee_columns(self, employees):
+        """Split employee rows into parallel per-field lists, indexed by row position"""
+        columns = {
+            'ids': [],
+            'restricted': [],
+            'min_rest_hours': [],
+            'max_consecutive_days': [],
+            'hours_per_week': [],
+            'special_schedule': [],
+            # Weekly hour ceiling: hours_per_week for LEGAL_CAP, unbounded otherwise
+            'weekly_cap': [],
+            # Static shift-type/LEAD eligibility
+            'day_ok': [],
+            'night_ok': []
+        }
         
         for emp in employees:
-            # Check shift type restrictions
-            if emp['shift_type'] == 'DAY' and shift_type == 'Night':
-                continue
-            if emp['shift_type'] == 'NIGHT' and shift_type == 'Day':
-                continue
-            
-            # Check day restrictions
-            if emp['cannot_work_days']:
-                restricted_days = json.loads(emp['cannot_work_days'])
-                if date.strftime('%a') in restricted_days:
-                    continue
-            
-            # Check rest period
-            if last_shift_end[emp['id']]:
-                time_since_last = (datetime.combine(date, time(0, 0)) - last_shift_end[emp['id']]).total_seconds() / 3600
-                if time_since_last < emp['min_rest_hours']:
-                    continue
-            
-            # Check consecutive days
-            if consecutive_days[emp['id']] >= emp['max_consecutive_days']:
-                continue
-            
-            # Check special schedules
-            if emp['special_schedule'] == 'LEAD' and shift_type == 'Night':
-                continue
-            if emp['special_schedule'] == 'LEGAL_CAP' and self.get_employee_weekly_hours(emp['id']) >= emp['hours_per_week']:
-                continue
-            
-            available.append(emp)
+            restricted = json.loads(emp['cannot_work_days']) if emp['cannot_work_days'] else None
+            restricted_mask = 0
+            for code in restricted or []:
+                if code in WEEKDAY_BITS:
+                    restricted_mask |= 1 << WEEKDAY_BITS[code]
+            columns['ids'].append(emp['id'])
+            columns['restricted'].append(restricted_mask)
+            columns['min_rest_hours'].append(emp['min_rest_hours'])
+            columns['max_consecutive_days'].append(emp['max_consecutive_days'])
+            columns['hours_per_week'].append(emp['hours_per_week'])
+            columns['special_schedule'].append(emp['special_schedule'])
+            columns['weekly_cap'].append(emp['hours_per_week'] if emp['special_schedule'] == 'LEGAL_CAP' else float('inf'))
+            columns['day_ok'].append(emp['shift_type'] != 'NIGHT')
+            columns['night_ok'].append(emp['shift_type'] != 'DAY' and emp['special_schedule'] != 'LEAD')
+        
+        # Restricted days repeat every week, so the static filter is resolved
+        # once per weekday rather than on every date: (position, day_ok, night_ok)
+        # for everyone who could work at least one shift that day
+        restricted = columns['restricted']
+        day_ok = columns['day_ok']
+        night_ok = columns['night_ok']
+        columns['candidates_by_weekday'] = [
+            tuple(
+                (i, day_ok[i], night_ok[i])
+                for i in range(len(employees))
+                if (day_ok[i] or night_ok[i]) and not (restricted[i] >> weekday) & 1
+            )
+            for weekday in range(7)
+        ]
+        
+        return columns
+    
+    def get_day_and_night_candidates(self, employees, date, last_shift_end, consecutive_days, week_hours, columns=None, weekday=None):
+        """Positions (into `employees`) available for Day and Night shifts, in one pass.
         
-        return available
+        `last_shift_end` (hours, see generate_schedule), `consecutive_days` and
+        `week_hours` (hours worked so far this week) are lists indexed the same way.
+        """
+        if columns is None:
+            columns = self.build_employee_columns(employees)
+        if weekday is None:
+            weekday = date.weekday()
+        
+        # Shift type, LEAD and restricted-day checks are already applied
+        return _filter_day_candidates(
+            columns['candidates_by_weekday'][weekday],
+            date.toordinal() * 24.0,
+            last_shift_end,
+            consecutive_days,
+            week_hours,
+            columns['min_rest_hours'],
+            columns['max_consecutive_days'],
+            columns['weekly_cap']
+        )
+    
+    def get_available_employees(self, employees, date, shift_type, last_shift_end, consecutive_days, week_hours, columns=None, weekday=None):
+        """Get positions (into `employees`) of employees available for a specific shift"""
+        day_available, night_available = self.get_day_and_night_candidates(
+            employees, date, last_shift_end, consecutive_days, week_hours, columns, weekday
+        )
+        return day_available if shift_type == 'Day' else night_available
     
-    def assign_shifts(self, shifts, available_employees, employee_hours, date, shift_type):
-        """Assign shifts to available employees using priority-based algorithm"""
+    def assign_shifts(self, shifts, available_employees, employee_hours, date, shift_type, employees, columns, week_hours=None):
+        """Assign shifts to available employees using priority-based algorithm.
+        
+        With `week_hours` (hours worked so far this week, by position), nobody
+        is given a shift that would take them past their weekly_cap.
+        """
         assignments = []
+        hours_per_week = columns['hours_per_week']
+        weekly_cap = columns['weekly_cap']
         
-        # Sort employees by priority (least hours first, then by availability)
-        available_employees.sort(key=lambda emp: (
-            employee_hours[emp['id']],
-            -emp['hours_per_week']  # Higher target hours get priority
-        ))
+        # Priority queue: least hours first, then higher target hours; the
+        # position breaks ties in roster order. Only as many employees as
+        # there are shifts get popped, so the rest are never fully sorted.
+        candidates = [(employee_hours[i], -hours_per_week[i], i) for i in available_employees]
+        heapq.heapify(candidates)
         
-        for i, (role, start_time, end_time, hours) in enumerate(shifts):
-            if i < len(available_employees):
-                emp = available_employees[i]
+        for shift in shifts:
+            # Candidates this shift would push over their cap stay eligible
+            # for the remaining (possibly shorter) shifts
+            over_cap = []
+            while candidates:
+                entry = heapq.heappop(candidates)
+                i = entry[2]
+                if week_hours is not None and week_hours[i] + shift.hours > weekly_cap[i]:
+                    over_cap.append(entry)
+                    continue
+                emp = employees[i]
                 assignments.append({
+                    'index': i,
                     'employee_id': emp['id'],
                     'employee_name': emp['name'],
                     'shift_type': shift_type,
-                    'role': role,
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'hours': hours
+                    'role': shift.role,
+                    'start_time': shift.start_time,
+                    'end_time': shift.end_time,
+                    'start_str': shift.start_str,
+                    'end_str': shift.end_str,
+                    'end_hours': shift.end_hours,
+                    'hours': shift.hours
                 })
+                break
+            for entry in over_cap:
+                heapq.heappush(candidates, entry)
         
         return assignments
     
-    def get_employee_weekly_hours(self, employee_id):
-        """Calculate weekly hours for an employee"""
-        # This would query the database for current week's hours
-        # For now, return 0 as a placeholder
-        return 0
-    
-    def update_consecutive_days(self, consecutive_days, employee_id, current_date):
+    def update_consecutive_days(self, consecutive_days, index, current_date):
         """Update consecutive days tracking"""
         # Reset consecutive days if there's a gap
         # This is a simplified implementation
@@ -163,10 +358,10 @@ class SchedulingEngine:
     
     def clear_non_working_days(self, consecutive_days, assignments):
         """Reset consecutive days for employees not working today"""
-        working_today = {assign['employee_id'] for assign in assignments}
-        for emp_id in consecutive_days:
-            if emp_id not in working_today:
-                consecutive_days[emp_id] = 0
+        working_today = {assign['index'] for assign in assignments}
+        for i in range(len(consecutive_days)):
+            if i not in working_today:
+                consecutive_days[i] = 0
 
 # Example usage
 if __name__ == '__main__':
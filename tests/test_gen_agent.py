@@ -27,9 +27,16 @@ Notes
 from __future__ import annotations
 import argparse
 import ast
+import concurrent.futures
+import functools
+import hashlib
+import heapq
+import operator
 import os
+import pickle
+import re
 import sys
-import textwrap
+import tempfile
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Optional, Tuple, Dict
@@ -44,9 +51,17 @@ IMPORTANT_FILENAME_BONUS = {
     "worker": 6,
 }
 
-EXCLUDE_DIRS = {"venv", ".venv", "__pycache__", ".git", "node_modules", "migrations", "env", ".env", "dist", "build", ".pytest_cache", ".mypy_cache", ".ruff_cache", ".tox", "site-packages", "data"}
+EXCLUDE_DIRS = frozenset({"venv", ".venv", "__pycache__", ".git", "node_modules", "migrations", "env", ".env", "dist", "build", ".pytest_cache", ".mypy_cache", ".ruff_cache", ".tox", "site-packages", "data"})
 
-@dataclass
+# test_*.py files under any of these directories are skipped
+TEST_DIRS = frozenset({"tests"})
+
+# Per-file analysis cache (pickled List[Item]) under <root>/.pytest_cache.
+# Bump CACHE_V whenever Item fields or the scoring/analysis logic change.
+CACHE_V = 5
+CACHE_SUBDIR = os.path.join(".pytest_cache", "gen_agent_ast")
+
+@dataclass(slots=True)
 class Item:
     kind: str  # "function" or "class" or "method"
     module: str  # dot-path module name
@@ -61,54 +76,88 @@ class Item:
     argspec: Optional[List[Tuple[str, Optional[str], bool, bool]]] = field(default=None)
     # argspec entries: (arg_name, type_hint, has_default, is_vararg/kw)
 
+def _walk(d: str, in_tests: bool):
+    try:
+        it = os.scandir(d)
+    except OSError:
+        return
+    subdirs = []
+    with it:
+        for e in it:
+            # DirEntry caches the dirent type, so no extra stat per entry
+            if e.is_dir(follow_symlinks=False):
+                if e.name not in EXCLUDE_DIRS:
+                    subdirs.append((e.path, in_tests or e.name in TEST_DIRS))
+            elif e.name.endswith(".py"):
+                # ignore tests we generate or existing tests
+                if in_tests and e.name.startswith("test_"):
+                    continue
+                yield Path(e.path)
+    # files before subdirectories, same order as os.walk
+    for path, sub_in_tests in subdirs:
+        yield from _walk(path, sub_in_tests)
+
 def iter_py_files(root: Path):
-    for p in root.rglob("*.py"):
-        if any(part in EXCLUDE_DIRS for part in p.parts):
-            continue
-        # ignore tests we generate or existing tests
-        if "tests" in p.parts and p.name.startswith("test_"):
-            continue
-        yield p
-
-def module_name_from_path(root: Path, file_path: Path) -> str:
-    rel = file_path.relative_to(root).with_suffix("")
-    parts = []
-    for part in rel.parts:
-        if part == "__init__":
-            continue
-        parts.append(part)
-    return ".".join(parts)
-
-def cyclomatic_complexity(node: ast.AST) -> int:
-    # very rough CC: count decision points
-    decision_nodes = (
-        ast.If, ast.For, ast.While, ast.Try, ast.With,
-        ast.BoolOp, ast.IfExp, ast.Match
-    )
-    comp_nodes = (ast.ListComp, ast.DictComp, ast.SetComp, ast.GeneratorExp)
-    count = 1
-    for n in ast.walk(node):
-        if isinstance(n, decision_nodes) or isinstance(n, comp_nodes):
-            count += 1
-    return count
+    yield from _walk(str(root), not TEST_DIRS.isdisjoint(root.parts))
+
+def _module_name(rel: str) -> str:
+    # rel is a root-relative path string such as "pkg/sub/__init__.py"
+    if rel.endswith(".py"):
+        rel = rel[:-3]
+    return ".".join(p for p in rel.split(os.sep) if p != "__init__")
+
+# very rough CC: decision points plus comprehensions, each adds one
+_CC_TYPES = (
+    ast.If, ast.For, ast.While, ast.Try, ast.With,
+    ast.BoolOp, ast.IfExp, ast.Match,
+    ast.ListComp, ast.DictComp, ast.SetComp, ast.GeneratorExp,
+)
 
 def get_end_lineno(node: ast.AST) -> int:
     return getattr(node, "end_lineno", getattr(node, "lineno", 0))
 
+# one named group per keyword, each inside a zero-width lookahead so that
+# overlapping keywords ("servicengine": service + engine) are all found.
+# Only the first alternative that matches at a position is reported, so a
+# keyword must never be a prefix of another ("app" would hide "application").
+_BONUS_PREFIXES = [(a, b) for a in IMPORTANT_FILENAME_BONUS for b in IMPORTANT_FILENAME_BONUS
+                   if a != b and b.startswith(a)]
+if _BONUS_PREFIXES:
+    raise ValueError(f"IMPORTANT_FILENAME_BONUS keys must not prefix each other: {_BONUS_PREFIXES}")
+_BONUS_RE = re.compile("|".join(f"(?=(?P<{k}>{re.escape(k)}))" for k in IMPORTANT_FILENAME_BONUS))
+
 def filename_bonus(path: Path) -> int:
-    base = path.stem.lower()
-    bonus = 0
-    for key, val in IMPORTANT_FILENAME_BONUS.items():
-        if key in base:
-            bonus += val
-    return bonus
+    return _stem_bonus(path.stem.lower())
+
+@functools.lru_cache(maxsize=None)
+def _stem_bonus(base: str) -> int:
+    # each keyword counts once, however often it appears
+    return sum(IMPORTANT_FILENAME_BONUS[k] for k in {m.lastgroup for m in _BONUS_RE.finditer(base)})
 
 def extract_type_str(ann: Optional[ast.AST]) -> Optional[str]:
     if ann is None:
         return None
+    # fast paths for the common shapes; must agree with ast.unparse.
+    # Results are interned: the same few annotations repeat across a repo.
+    if isinstance(ann, ast.Name):
+        return ann.id  # the parser already interns identifiers
+    if isinstance(ann, ast.Constant) and ann.value is None:
+        return "None"
+    if isinstance(ann, ast.Attribute):
+        parts = []
+        n = ann
+        while isinstance(n, ast.Attribute):
+            parts.append(n.attr)
+            n = n.value
+        if isinstance(n, ast.Name):
+            parts.append(n.id)
+            return sys.intern(".".join(reversed(parts)))
+    elif (isinstance(ann, ast.Subscript) and isinstance(ann.value, ast.Name)
+          and isinstance(ann.slice, ast.Name)):
+        return sys.intern(f"{ann.value.id}[{ann.slice.id}]")
     try:
         # best-effort pretty printing of annotation
-        return ast.unparse(ann)  # Python 3.9+
+        return sys.intern(ast.unparse(ann))  # Python 3.9+
     except Exception:
         return None
 
@@ -134,6 +183,121 @@ def argspec_for_function(fn: ast.FunctionDef | ast.AsyncFunctionDef) -> List[Tup
     spec = [s for s in spec if s[0] not in ("self", "cls")]
     return spec
 
+def cached_analysis(fn):
+    """Memoize analyze_file results on disk, keyed by file path, mtime and size."""
+    @functools.wraps(fn)
+    def wrapper(root: Path, file_path: Path) -> List[Item]:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return fn(root, file_path)
+        key = repr((CACHE_V, str(root), str(file_path), st.st_mtime_ns, st.st_size))
+        cache_dir = root / CACHE_SUBDIR
+        cache_file = cache_dir / (hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + ".pkl")
+        try:
+            with open(cache_file, "rb") as fh:
+                return pickle.load(fh)
+        except Exception:
+            pass  # missing or unreadable entry: analyze and (re)write it
+
+        items = fn(root, file_path)
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(items, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass  # cache is best-effort; read-only trees still work
+        return items
+    return wrapper
+
+class _Analyzer(ast.NodeVisitor):
+    """
+    One pass over a module AST that computes cyclomatic complexity for every
+    function/class and emits the Items analyze_file reports: top-level
+    functions, top-level classes and their public methods.
+
+    cc_stack holds one counter per open function/class scope (plus one for the
+    module). When a scope closes, its decision points are added to the
+    enclosing scope, so a class counts everything inside its methods just
+    like a full ast.walk would.
+    """
+
+    def __init__(self, tree: ast.Module, mod_name: str, relpath: str, fbonus: int):
+        self.mod_name = mod_name
+        self.relpath = relpath
+        self.fbonus = fbonus
+        self.items: List[Item] = []
+        self.cc_stack: List[int] = [1]
+        self._top_level = {id(n) for n in tree.body}
+        self._methods: set = set()
+        self._class_name = ""
+        self._pending_methods: List[Item] = []
+
+    # decision points; bound as visit_<Type> for every _CC_TYPES entry below
+    def _count(self, node: ast.AST):
+        self.cc_stack[-1] += 1
+        self.generic_visit(node)
+
+    def _scope(self, node: ast.AST) -> int:
+        self.cc_stack.append(1)
+        self.generic_visit(node)
+        cc = self.cc_stack.pop()
+        self.cc_stack[-1] += cc - 1
+        return cc
+
+    def _item(self, kind: str, node: ast.AST, qualname: str, cc: int, bonus: int, argspec=None) -> Item:
+        lineno = node.lineno
+        end_lineno = get_end_lineno(node)
+        loc = max(1, end_lineno - lineno + 1)
+        return Item(
+            kind=kind,
+            module=self.mod_name,
+            relpath=self.relpath,
+            name=node.name,
+            qualname=qualname,
+            lineno=lineno,
+            end_lineno=end_lineno,
+            loc=loc,
+            complexity=cc,
+            score=0.7 * loc + 0.3 * (cc * 10) + self.fbonus + bonus,
+            argspec=argspec,
+        )
+
+    def visit_FunctionDef(self, node: ast.FunctionDef | ast.AsyncFunctionDef):
+        cc = self._scope(node)
+        if id(node) in self._top_level:
+            # top-level functions; private helpers are never tested
+            if node.name.startswith("_"):
+                return
+            self.items.append(self._item("function", node, node.name, cc, 0, argspec_for_function(node)))
+        elif id(node) in self._methods and not node.name.startswith("_"):
+            # methods
+            self._pending_methods.append(
+                self._item("method", node, f"{self._class_name}.{node.name}", cc, 3, argspec_for_function(node))
+            )
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        if id(node) not in self._top_level:
+            self._scope(node)
+            return
+        saved = (self._methods, self._class_name, self._pending_methods)
+        self._methods = {id(b) for b in node.body if isinstance(b, (ast.FunctionDef, ast.AsyncFunctionDef))}
+        self._class_name = node.name
+        self._pending_methods = []
+        cc = self._scope(node)
+        # class score by body span, slight bonus for classes; methods follow their class
+        self.items.append(self._item("class", node, node.name, cc, 5))
+        self.items.extend(self._pending_methods)
+        self._methods, self._class_name, self._pending_methods = saved
+
+for _cc_type in _CC_TYPES:
+    setattr(_Analyzer, f"visit_{_cc_type.__name__}", _Analyzer._count)
+
+@cached_analysis
 def analyze_file(root: Path, file_path: Path) -> List[Item]:
     items: List[Item] = []
     try:
@@ -141,80 +305,24 @@ def analyze_file(root: Path, file_path: Path) -> List[Item]:
     except Exception:
         return items
     try:
-        tree = ast.parse(src, filename=str(file_path))
+        # type comments are never inspected; say so explicitly
+        tree = ast.parse(src, filename=str(file_path), type_comments=False)
     except SyntaxError:
         return items
+    del src  # only the tree is needed from here on
 
-    mod_name = module_name_from_path(root, file_path)
+    # per-file values, computed once and shared by every Item from this file
+    rel = str(file_path.relative_to(root))
+    mod_name = _module_name(rel)
     fbonus = filename_bonus(file_path)
 
-    for node in tree.body:
-        # top-level functions
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            loc = max(1, get_end_lineno(node) - node.lineno + 1)
-            cc = cyclomatic_complexity(node)
-            score = 0.7 * loc + 0.3 * (cc * 10) + fbonus
-            items.append(
-                Item(
-                    kind="function",
-                    module=mod_name,
-                    relpath=str(file_path.relative_to(root)),
-                    name=node.name,
-                    qualname=node.name,
-                    lineno=node.lineno,
-                    end_lineno=get_end_lineno(node),
-                    loc=loc,
-                    complexity=cc,
-                    score=score,
-                    argspec=argspec_for_function(node),
-                )
-            )
-        # classes and methods
-        if isinstance(node, ast.ClassDef):
-            # class score by body span
-            loc = max(1, get_end_lineno(node) - node.lineno + 1)
-            cc = cyclomatic_complexity(node)
-            score = 0.7 * loc + 0.3 * (cc * 10) + fbonus + 5  # slight bonus for classes
-            items.append(
-                Item(
-                    kind="class",
-                    module=mod_name,
-                    relpath=str(file_path.relative_to(root)),
-                    name=node.name,
-                    qualname=node.name,
-                    lineno=node.lineno,
-                    end_lineno=get_end_lineno(node),
-                    loc=loc,
-                    complexity=cc,
-                    score=score,
-                )
-            )
-            # methods
-            for b in node.body:
-                if isinstance(b, (ast.FunctionDef, ast.AsyncFunctionDef)) and not b.name.startswith("_"):
-                    locm = max(1, get_end_lineno(b) - b.lineno + 1)
-                    ccm = cyclomatic_complexity(b)
-                    scorem = 0.7 * locm + 0.3 * (ccm * 10) + fbonus + 3
-                    items.append(
-                        Item(
-                            kind="method",
-                            module=mod_name,
-                            relpath=str(file_path.relative_to(root)),
-                            name=b.name,
-                            qualname=f"{node.name}.{b.name}",
-                            lineno=b.lineno,
-                            end_lineno=get_end_lineno(b),
-                            loc=locm,
-                            complexity=ccm,
-                            score=scorem,
-                            argspec=argspec_for_function(b),
-                        )
-                    )
-    return items
+    analyzer = _Analyzer(tree, mod_name, rel, fbonus)
+    analyzer.visit(tree)
+    return analyzer.items
 
 # ---- Test code generation ----------------------------------------------------
 
-DUMMY_VALUES_BY_ANNOTATION = {
+DUMMY_VALUES_BY_ANNOTATION = {sys.intern(k): v for k, v in {
     "int": "0",
     "float": "0.0",
     "str": "''",
@@ -227,60 +335,109 @@ DUMMY_VALUES_BY_ANNOTATION = {
     "typing.Optional[float]": "0.0",
     "typing.Optional[str]": "''",
     "typing.Optional[bool]": "False",
-}
+}.items()}
+
+# Optional[X], X|None and None|X (matched with spaces already stripped)
+_OPT_RE = re.compile(r"^Optional\[(.+)\]$|^(.+)\|None$|^None\|(.+)$")
 
 def dummy_arg_for(type_hint: Optional[str], has_default: bool, is_vararg: bool) -> Optional[str]:
     if is_vararg:
         return None  # we won't try to pass *args/**kwargs in auto mode
     if type_hint:
         t = type_hint.replace(" ", "")
-        # strip Optional[...] to inner if possible
-        if t.startswith("Optional[") and t.endswith("]"):
-            inner = t[len("Optional["):-1]
+        # strip the optional wrapper to inner if possible; None is always acceptable then
+        m = _OPT_RE.match(t)
+        if m:
+            inner = m.group(1) or m.group(2) or m.group(3)
             return DUMMY_VALUES_BY_ANNOTATION.get(inner, "None")
         return DUMMY_VALUES_BY_ANNOTATION.get(t, "None" if has_default else None)
     return "None" if has_default else None
 
-def render_test_header(repo_root: str) -> str:
-    return textwrap.dedent(f"""
-    # AUTOGENERATED BY generate_pytest_agent.py
-    import os, sys, importlib, inspect, pytest
+# Templates are stored flush-left (already dedented) and filled with str.format,
+# so rendering never re-scans them with textwrap.dedent.
+_HEADER_TMPL = """
+# AUTOGENERATED BY generate_pytest_agent.py
+import os, sys, importlib, inspect, pytest
+
+# Ensure repo root on sys.path for module imports
+REPO_ROOT = os.path.abspath({repo_root})
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-    # Ensure repo root on sys.path for module imports
-    REPO_ROOT = os.path.abspath({repo_root!r})
-    if REPO_ROOT not in sys.path:
-        sys.path.insert(0, REPO_ROOT)
+"""
 
-    """)
+_IMPORT_TEST_TMPL = """
+def test_import_module__{safe_name}():
+    try:
+        m = importlib.import_module({module_repr})
+        assert m is not None
+    except Exception as e:
+        pytest.fail(f"Failed to import {{ {module_repr} }}: {{e}}")
+"""
+
+_CLASS_TEST_TMPL = """
+def test_class_instantiation__{safe}():
+    m = importlib.import_module({module_repr})
+    cls = getattr(m, {class_repr}, None)
+    assert cls is not None, "Class {class_name} not found in {module}"
+    try:
+        obj = cls()  # best-effort no-arg
+    except TypeError:
+        pytest.skip("Constructor for {class_name} requires args; edit test to provide fixtures.")
+    except Exception as e:
+        pytest.xfail(f"Instantiation raised {{e}}; manual review needed.")
+"""
+
+_METHOD_BODY_TMPL = """
+    m = importlib.import_module({module_repr})
+    cls = getattr(m, {cls_repr}, None)
+    assert cls is not None, "Class {cls} not found in {module}"
+    try:
+        obj = cls()
+    except TypeError:
+        pytest.skip("Constructor for {cls} requires args; edit test to provide fixtures.")
+    fn = getattr(obj, {meth_repr}, None)
+    assert callable(fn), "Method {meth} not found or not callable\""""
+
+_FUNCTION_BODY_TMPL = """
+    m = importlib.import_module({module_repr})
+    fn = getattr(m, {qualname_repr}, None)
+    assert callable(fn), "Function {qualname} not found or not callable\""""
+
+# call tests are assembled with "".join around these fixed fragments
+_CALL_HEAD = "\ndef test_call__"
+_CALL_SKIP = "    # decide to skip if no safe args\n    pytest.skip('No safe dummy args; edit test to supply fixtures.')\n"
+_CALL_TAIL = (
+    "\n    except Exception as e:\n"
+    "        pytest.xfail(f\"Auto-call raised {e}; requires human-provided fixtures.\")\n"
+)
+
+_safe_mod_cache: Dict[str, str] = {}
+
+def _safe_module(module: str) -> str:
+    # dotted module name -> identifier fragment; a module repeats across many items
+    safe = _safe_mod_cache.get(module)
+    if safe is None:
+        safe = _safe_mod_cache[module] = module.replace(".", "_")
+    return safe
+
+def render_test_header(repo_root: str) -> str:
+    return _HEADER_TMPL.format(repo_root=repr(repo_root))
 
 def render_module_import_test(module: str) -> str:
-    safe_name = module.replace(".", "_")
-    return textwrap.dedent(f"""
-    def test_import_module__{safe_name}():
-        try:
-            m = importlib.import_module({module!r})
-            assert m is not None
-        except Exception as e:
-            pytest.fail(f"Failed to import {{ {module!r} }}: {{e}}")
-    """)
+    return _IMPORT_TEST_TMPL.format(safe_name=_safe_module(module), module_repr=repr(module))
 
 def render_class_test(module: str, class_name: str) -> str:
-    safe = f"{module.replace('.', '_')}__{class_name}"
-    return textwrap.dedent(f"""
-    def test_class_instantiation__{safe}():
-        m = importlib.import_module({module!r})
-        cls = getattr(m, {class_name!r}, None)
-        assert cls is not None, "Class {class_name} not found in {module}"
-        try:
-            obj = cls()  # best-effort no-arg
-        except TypeError:
-            pytest.skip("Constructor for {class_name} requires args; edit test to provide fixtures.")
-        except Exception as e:
-            pytest.xfail(f"Instantiation raised {{e}}; manual review needed.")
-    """)
+    return _CLASS_TEST_TMPL.format(
+        safe=f"{_safe_module(module)}__{class_name}",
+        module=module,
+        module_repr=repr(module),
+        class_name=class_name,
+        class_repr=repr(class_name),
+    )
 
 def render_function_call_test(module: str, qualname: str, argspec: Optional[List[Tuple[str, Optional[str], bool, bool]]]) -> str:
-    safe = f"{module.replace('.', '_')}__{qualname.replace('.', '__')}"
+    safe = f"{_safe_module(module)}__{qualname.replace('.', '__')}"
     # Build arg list
     call_args: List[str] = []
     need_skip = False
@@ -290,69 +447,54 @@ def render_function_call_test(module: str, qualname: str, argspec: Optional[List
             if val is None:
                 need_skip = True
             else:
-                call_args.append(f"{val}")
-    call_args_str = ", ".join(call_args)
-    skip_line = "pytest.skip('No safe dummy args; edit test to supply fixtures.')" if need_skip and not call_args else ""
-    target_expr = qualname  # "func" or "Class.method" accessed via getattr chain
+                call_args.append(val)
 
     # Build getattr chain for methods
     if "." in qualname:
         cls, meth = qualname.split(".", 1)
-        body = f"""
-        m = importlib.import_module({module!r})
-        cls = getattr(m, {cls!r}, None)
-        assert cls is not None, "Class {cls} not found in {module}"
-        try:
-            obj = cls()
-        except TypeError:
-            pytest.skip("Constructor for {cls} requires args; edit test to provide fixtures.")
-        fn = getattr(obj, {meth!r}, None)
-        assert callable(fn), "Method {meth} not found or not callable"
-        """
-        call = f"fn({call_args_str})" if call_args_str else "fn()"
+        body = _METHOD_BODY_TMPL.format(
+            module=module, module_repr=repr(module),
+            cls=cls, cls_repr=repr(cls),
+            meth=meth, meth_repr=repr(meth),
+        )
     else:
-        body = f"""
-        m = importlib.import_module({module!r})
-        fn = getattr(m, {qualname!r}, None)
-        assert callable(fn), "Function {qualname} not found or not callable"
-        """
-        call = f"fn({call_args_str})" if call_args_str else "fn()"
-
-    return textwrap.dedent(f"""
-    def test_call__{safe}():
-        {"pass" if not (body or call) else body}
-        {";" if body.strip().endswith(":") else ""}
-        {"# decide to skip if no safe args" if skip_line else ""}
-        {skip_line}
-        try:
-            _ = {call}
-        except Exception as e:
-            pytest.xfail(f"Auto-call raised {{e}}; requires human-provided fixtures.")
-    """)
+        body = _FUNCTION_BODY_TMPL.format(
+            module_repr=repr(module), qualname=qualname, qualname_repr=repr(qualname),
+        )
+
+    return "".join((
+        _CALL_HEAD, safe, "():\n", body, "\n\n\n",
+        _CALL_SKIP if need_skip and not call_args else "\n\n",
+        "    try:\n        _ = fn(", ", ".join(call_args), ")",
+        _CALL_TAIL,
+    ))
 
 def generate_tests(root: Path, items: List[Item], top_n: int, outfile: Path):
     # sort and take top N, but ensure we include at least one import test per module selected
-    items_sorted = sorted(items, key=lambda x: x.score, reverse=True)[:top_n]
+    # same ordering as sorted(..., reverse=True)[:top_n], ties included
+    items_sorted = heapq.nlargest(top_n, items, key=operator.attrgetter("score"))
     modules = sorted({it.module for it in items_sorted})
 
-    lines: List[str] = []
-    lines.append(render_test_header(str(root)))
-    # Module imports first
-    for mod in modules:
-        lines.append(render_module_import_test(mod))
-
-    # Then class instantiation tests for high-scoring classes
-    for it in items_sorted:
-        if it.kind == "class":
-            lines.append(render_class_test(it.module, it.name))
-
-    # Then function/method calls
-    for it in items_sorted:
-        if it.kind in ("function", "method"):
-            lines.append(render_function_call_test(it.module, it.qualname, it.argspec))
-
     outfile.parent.mkdir(parents=True, exist_ok=True)
-    outfile.write_text("\n".join(lines), encoding="utf-8")
+    # Blocks are written as they are rendered; nothing holds the whole file
+    with outfile.open("w", encoding="utf-8", buffering=1 << 20) as fh:
+        fh.write(render_test_header(str(root)))
+        # Module imports first
+        for mod in modules:
+            fh.write("\n")
+            fh.write(render_module_import_test(mod))
+
+        # Then class instantiation tests for high-scoring classes
+        for it in items_sorted:
+            if it.kind == "class":
+                fh.write("\n")
+                fh.write(render_class_test(it.module, it.name))
+
+        # Then function/method calls
+        for it in items_sorted:
+            if it.kind in ("function", "method"):
+                fh.write("\n")
+                fh.write(render_function_call_test(it.module, it.qualname, it.argspec))
 
 def main():
     ap = argparse.ArgumentParser(description="Generate pytest smoke tests for important code.")
@@ -366,16 +508,25 @@ def main():
         print(f"Root {root} not found", file=sys.stderr)
         sys.exit(1)
 
+    # Parsing is CPU-bound and independent per file; fan it out across processes
+    files = list(iter_py_files(root))
+    workers = os.cpu_count() or 1
+    chunksize = max(1, len(files) // (workers * 4))
     all_items: List[Item] = []
-    for f in iter_py_files(root):
-        all_items.extend(analyze_file(root, f))
+    all_modules: set[str] = set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
+        for result in ex.map(functools.partial(analyze_file, root), files, chunksize=chunksize):
+            if result:
+                # every Item from one file shares its module
+                all_modules.add(result[0].module)
+                all_items.extend(result)
 
     if not all_items:
         print("No Python items found to analyze.")
         sys.exit(2)
 
     generate_tests(root, all_items, args.top_n, Path(args.outfile))
-    print(f"✅ Generated {args.outfile} with {min(args.top_n, len(all_items))} targets across {len({i.module for i in all_items})} modules.")
+    print(f"✅ Generated {args.outfile} with {min(args.top_n, len(all_items))} targets across {len(all_modules)} modules.")
     print("Run with: pytest -q")
 
 if __name__ == "__main__":